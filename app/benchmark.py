@@ -0,0 +1,528 @@
+# benchmark.py
+# Ad-hoc performance comparisons against the databases configured in .env.
+# Usage: python benchmark.py ingest --nodes 50000 --batch-size 5000
+#        python benchmark.py propagate --nodes 50000 --runs 20
+#        python benchmark.py validate --nodes 100000
+#        python benchmark.py load --url http://localhost:8000/api/graphs --clients 100 --seconds 30
+#        python benchmark.py suite --url http://localhost:8000 --nodes 1000 --output bench_results.json
+#        python benchmark.py compare old_results.json new_results.json
+import argparse
+import asyncio
+import json
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from schemas import GraphSchema
+from graph_engine import CompiledGraph
+from neo4j_database import get_driver, close_driver
+from neo4j_crud import create_graph_in_neo4j, delete_graph_in_neo4j
+
+
+GRAPH_SHAPES = ("linear", "wide", "deep", "diamond", "random")
+
+
+def _edge_pairs(num_nodes, shape, max_fan_in, rng):
+    """(src, dst) node indexes of a connected DAG of `shape`; every edge goes from a lower to a higher index."""
+    if shape == "linear" or num_nodes < 3:
+        # A single chain: one node per topological generation
+        return [(dst - 1, dst) for dst in range(1, num_nodes)]
+    if shape == "wide":
+        # One root fanning out to every middle node, which all feed one sink: two generations wide
+        sink = num_nodes - 1
+        return [(0, middle) for middle in range(1, sink)] + [(middle, sink) for middle in range(1, sink)]
+    if shape == "deep":
+        # A chain with skip connections from two nodes back
+        return [(src, dst) for dst in range(1, num_nodes) for src in (dst - 2, dst - 1) if src >= 0]
+    if shape == "diamond":
+        # Chained diamonds: top -> left, top -> right, left -> next top, right -> next top
+        pairs = []
+        for dst in range(1, num_nodes):
+            if dst % 3 == 1:
+                pairs.append((dst - 1, dst))
+            elif dst % 3 == 2:
+                pairs.append((dst - 2, dst))
+            else:
+                pairs.extend([(dst - 2, dst), (dst - 1, dst)])
+        return pairs
+    # random: node i receives edges from up to `max_fan_in` earlier nodes, always including node i - 1
+    return [
+        (src, dst)
+        for dst in range(1, num_nodes)
+        for src in sorted({dst - 1} | {rng.randrange(dst) for _ in range(max_fan_in - 1)})
+    ]
+
+
+def graph_data(num_nodes, shape="random", max_fan_in=2, keys=1, seed=0):
+    """
+    Build a connected DAG of `shape` (one of GRAPH_SHAPES) as the JSON body of /create-graph.
+
+    Every node has `keys` input keys and `keys` output keys, and every edge maps each output key
+    to the input key of the same number, so `keys` sets the key-mapping density of the graph.
+    """
+    rng = random.Random(seed)
+    nodes = [
+        {
+            "node_id": f"node_{i}",
+            "data_in": {f"in{key}": 0 for key in range(keys)},
+            "data_out": {f"out{key}": i for key in range(keys)},
+            "paths_in": [],
+            "paths_out": [],
+        }
+        for i in range(num_nodes)
+    ]
+    edges = []
+    for src, dst in _edge_pairs(num_nodes, shape, max_fan_in, rng):
+        edge = {
+            "edge_id": f"edge_{src}_{dst}",
+            "src_node": f"node_{src}",
+            "dst_node": f"node_{dst}",
+            "src_to_dst_data_keys": {f"out{key}": f"in{key}" for key in range(keys)},
+        }
+        edges.append(edge)
+        nodes[src]["paths_out"].append(edge)
+        nodes[dst]["paths_in"].append(edge)
+    return {"nodes": nodes, "edges": edges}
+
+
+def make_graph(num_nodes, max_fan_in=2, seed=0, shape="random", keys=1):
+    """Build a connected DAG as a GraphSchema (see `graph_data`)."""
+    return GraphSchema(**graph_data(num_nodes, shape=shape, max_fan_in=max_fan_in, keys=keys, seed=seed))
+
+
+async def create_graph_row_by_row(graph_data):
+    """The original ingestion path: one autocommit transaction per node, PART_OF link and edge."""
+    graph_id = str(graph_data.id)
+    async with get_driver().session() as session:
+        await (await session.run("CREATE (g:Graph {graph_id: $graph_id})", graph_id=graph_id)).consume()
+        for node in graph_data.nodes:
+            await (await session.run(
+                "CREATE (n:Node {node_id: $node_id, data_in: $data_in, data_out: $data_out, graph_id: $graph_id})",
+                node_id=node.node_id, graph_id=graph_id,
+                data_in=json.dumps(node.data_in), data_out=json.dumps(node.data_out),
+            )).consume()
+            await (await session.run(
+                """
+                MATCH (g:Graph {graph_id: $graph_id}), (n:Node {node_id: $node_id, graph_id: $graph_id})
+                CREATE (n)-[:PART_OF]->(g)
+                """,
+                graph_id=graph_id, node_id=node.node_id,
+            )).consume()
+        for edge in graph_data.edges:
+            await (await session.run(
+                """
+                MATCH (src:Node {node_id: $src_node, graph_id: $graph_id}),
+                      (dst:Node {node_id: $dst_node, graph_id: $graph_id})
+                CREATE (src)-[e:EDGE {edge_id: $edge_id, src_to_dst_data_keys: $src_to_dst_data_keys}]->(dst)
+                """,
+                src_node=edge.src_node, dst_node=edge.dst_node, edge_id=edge.edge_id, graph_id=graph_id,
+                src_to_dst_data_keys=json.dumps(edge.src_to_dst_data_keys),
+            )).consume()
+
+
+def to_run_data(graph):
+    """Convert a GraphSchema into the `nodes_data` / `edges_data` shape used by a run."""
+    nodes_data = {node.node_id: {"data_in": dict(node.data_in), "data_out": dict(node.data_out)} for node in graph.nodes}
+    edges_data = [
+        {"src": edge.src_node, "dst": edge.dst_node, "src_to_dst_data_keys": dict(edge.src_to_dst_data_keys)}
+        for edge in graph.edges
+    ]
+    return nodes_data, edges_data
+
+
+# ---- Reference implementations ---- #
+# Dict-based propagation the compiled ExecutionPlan replaced; kept only as the baseline for `propagate`.
+
+class GraphCycleError(ValueError):
+    """Raised when a (sub)graph cannot be fully ordered because some of its nodes form a cycle."""
+
+    def __init__(self, nodes):
+        super().__init__(f"The graph contains a cycle; {len(nodes)} node(s) cannot be ordered: {nodes}")
+        self.nodes = nodes  # Nodes on a cycle or downstream of one
+
+
+def topological_sort(nodes_data, edges_data):
+    # 1. Building the adjacency list and in-degrees:
+    # - Iterates over E edges.
+    # - Time complexity: O(E).
+
+    # 2. Topological sorting (Kahn's algorithm):
+    # - The algorithm traverses all nodes and edges.
+    # - Time complexity: O(N + E), where N is the number of nodes and E is the number of edges.
+    in_degree = {node_id: 0 for node_id in nodes_data}
+    adjacency_list = {node_id: [] for node_id in nodes_data}
+    
+    for edge in edges_data:
+        src, dst = edge["src"], edge["dst"]
+        if src in adjacency_list and dst in in_degree:
+            adjacency_list[src].append(edge)
+            in_degree[dst] += 1
+
+    zero_in_degree = deque([node for node in in_degree if in_degree[node] == 0])
+    topo_order = []
+
+    while zero_in_degree:
+        node = zero_in_degree.popleft()
+        topo_order.append(node)
+        for edge in adjacency_list[node]:
+            dst = edge["dst"]
+            in_degree[dst] -= 1
+            if in_degree[dst] == 0:
+                zero_in_degree.append(dst)
+
+    # 3. Cycle detection:
+    # - Nodes whose in-degree never reached zero lie on a cycle or downstream of one.
+    # - Time complexity: O(N).
+    if len(topo_order) < len(in_degree):
+        raise GraphCycleError([node for node in in_degree if in_degree[node] > 0])
+
+    return topo_order
+
+
+def propagate_data(nodes_data, edges_data, topo_order):
+    # - Iterating over each node and edge to propagate data.
+    # - Time complexity: O(E).
+    adjacency_list = {node_id: [] for node_id in nodes_data}
+    for edge in edges_data:
+        adjacency_list[edge["src"]].append(edge)
+
+    for node in topo_order:
+        for edge in adjacency_list[node]:
+            src, dst = edge["src"], edge["dst"]
+            for src_key, dst_key in edge["src_to_dst_data_keys"].items():
+                dst_data_in = nodes_data[dst]["data_in"]
+                src_data_out = nodes_data[src]["data_out"]
+                dst_data_in[dst_key] = src_data_out.get(src_key)
+
+
+def bench_propagate(args):
+    """Per-run propagation cost: dict-based propagate_data vs the compiled ExecutionPlan (no database needed)."""
+    nodes_data, edges_data = to_run_data(make_graph(args.nodes, max_fan_in=args.fan_in))
+    compiled = CompiledGraph("benchmark", nodes_data, edges_data)
+    plan = compiled.execution_plan()
+
+    def run_dicts():
+        run_nodes = {node_id: {"data_in": dict(node["data_in"]), "data_out": dict(node["data_out"])}
+                     for node_id, node in nodes_data.items()}
+        propagate_data(run_nodes, edges_data, topological_sort(run_nodes, edges_data))
+        return run_nodes
+
+    def run_plan():
+        run_nodes, _ = compiled.subgraph(plan.active)
+        plan.execute(run_nodes)
+        return run_nodes
+
+    assert run_dicts() == run_plan(), "ExecutionPlan result differs from propagate_data"
+
+    results = {}
+    for name, run in (("propagate_data", run_dicts), ("execution_plan", run_plan)):
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            run()
+        per_run_ms = (time.perf_counter() - start) * 1000 / args.runs
+        results[name] = {"per_run_ms": round(per_run_ms, 3)}
+        print(f"{name:>15}: {len(nodes_data)} nodes, {len(edges_data)} edges, {per_run_ms:.2f} ms/run")
+    return results
+
+
+def bench_validate(args):
+    """Time GraphSchema.validate_graph_structure on a synthetic graph (no database needed)."""
+    graph = make_graph(args.nodes, max_fan_in=args.fan_in)
+    start = time.perf_counter()
+    GraphSchema.validate_graph_structure(graph)
+    seconds = time.perf_counter() - start
+    print(f"validate_graph_structure: {args.nodes} nodes, {len(graph.edges)} edges in {seconds:.3f}s")
+    return {"seconds": round(seconds, 3)}
+
+
+async def bench_ingest(args):
+    """Compare per-row ingestion with batched UNWIND ingestion on the same synthetic graph."""
+    results = {}
+    for name in ("row_by_row", "batched"):
+        if name == "row_by_row" and args.skip_row_by_row:
+            continue
+        graph = make_graph(args.nodes)
+        start = time.perf_counter()
+        if name == "row_by_row":
+            await create_graph_row_by_row(graph)
+        else:
+            await create_graph_in_neo4j(graph, batch_size=args.batch_size)
+        seconds = time.perf_counter() - start
+        await delete_graph_in_neo4j(str(graph.id))
+        results[name] = {"seconds": round(seconds, 3), "nodes_per_sec": round(args.nodes / seconds, 1)}
+        print(f"{name:>12}: {args.nodes} nodes, {len(graph.edges)} edges in {seconds:.3f}s "
+              f"({args.nodes / seconds:,.0f} nodes/sec)")
+    return results
+
+
+def bench_load(args):
+    """
+    Drive a running API with `--clients` concurrent clients for `--seconds` and report requests/sec.
+
+    Each client is a thread issuing requests back to back, so throughput is bounded by the
+    server: run it against the app before and after a change to compare its concurrency.
+    """
+    body = args.body.encode() if args.body else None
+    headers = {"Content-Type": "application/json"} if body else {}
+    deadline = time.perf_counter() + args.seconds
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def client():
+        while time.perf_counter() < deadline:
+            request = urllib.request.Request(args.url, data=body, headers=headers, method=args.method)
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=args.timeout) as response:
+                    response.read()
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        for _ in range(args.clients):
+            executor.submit(client)
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    results = {
+        "clients": args.clients,
+        "requests": len(latencies),
+        "errors": errors[0],
+        "requests_per_sec": round(len(latencies) / seconds, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2) if latencies else None,
+    }
+    print(f"{args.method} {args.url}: {args.clients} clients, {results['requests_per_sec']} req/s, "
+          f"p50 {results['p50_ms']} ms, p99 {results['p99_ms']} ms, {results['errors']} errors")
+    return results
+
+
+def _http_json(url, method="GET", body=None, timeout=60):
+    """Send one request and return the decoded JSON response."""
+    data = json.dumps(body).encode() if body is not None else None
+    headers = {"Content-Type": "application/json"} if data is not None else {}
+    request = urllib.request.Request(url, data=data, headers=headers, method=method)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def _timed_requests(send, count, clients):
+    """
+    Call `send(i)` for i in range(count) from `clients` threads and summarize the latencies.
+
+    Returns:
+        tuple: (latency and throughput statistics, list of the responses in call order).
+    """
+    latencies = [0.0] * count
+
+    def timed(i):
+        start = time.perf_counter()
+        response = send(i)
+        latencies[i] = time.perf_counter() - start
+        return response
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        responses = list(executor.map(timed, range(count)))
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    percentile = lambda q: round(latencies[min(count - 1, int(count * q))] * 1000, 2)
+    return {
+        "requests": count,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(latencies[-1] * 1000, 2),
+        "requests_per_sec": round(count / seconds, 1),
+    }, responses
+
+
+def _peak_rss_mb(pid=None):
+    """Peak resident set size of process `pid` (Linux /proc), or of this process when no pid is given."""
+    if pid is None:
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return None
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_suite(args):
+    """
+    Drive the create, run and read endpoints of a running API with synthetic graphs of every shape.
+
+    For each shape a graph of `--nodes` nodes is created `--create-repeats` times, then `--requests`
+    runs, graph reads, run output reads and leaf output reads are issued from `--clients` threads.
+    Latency percentiles, throughput and peak RSS (of the server with `--server-pid`, and of this client)
+    are written to `--output` with sorted keys, so result files of two commits can be diffed or
+    compared with the `compare` command.
+    """
+    base = args.url.rstrip("/")
+    results = {
+        "meta": {
+            "revision": _git_revision(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "url": base,
+            "nodes": args.nodes,
+            "fan_in": args.fan_in,
+            "keys": args.keys,
+            "requests": args.requests,
+            "clients": args.clients,
+        },
+        "shapes": {},
+    }
+
+    for shape in args.shapes:
+        body = graph_data(args.nodes, shape=shape, max_fan_in=args.fan_in, keys=args.keys)
+        endpoints = {}
+        endpoints["create_graph"], graph_ids = _timed_requests(
+            lambda i: _http_json(f"{base}/create-graph", "POST", body, args.timeout), args.create_repeats, 1,
+        )
+        graph_id = graph_ids[0]
+
+        endpoints["run_graph"], runs = _timed_requests(
+            lambda i: _http_json(f"{base}/run-graph", "POST", {
+                "graph_id": graph_id,
+                "root_inputs": {"node_0": {"in0": i}},
+                "data_overwrites": {},
+                "memoize": False,
+            }, args.timeout),
+            args.requests, args.clients,
+        )
+        run_ids = [run["run_id"] for run in runs]
+
+        endpoints["get_graph"], _ = _timed_requests(
+            lambda i: _http_json(f"{base}/api/graphs/{graph_id}", timeout=args.timeout), args.requests, args.clients,
+        )
+        endpoints["get_graph_output"], _ = _timed_requests(
+            lambda i: _http_json(f"{base}/output/{run_ids[i]}", timeout=args.timeout), args.requests, args.clients,
+        )
+        endpoints["get_leaf_outputs"], _ = _timed_requests(
+            lambda i: _http_json(f"{base}/get-leaf-outputs", "POST", {"graph_id": graph_id, "run_id": run_ids[i]},
+                                 args.timeout),
+            args.requests, args.clients,
+        )
+
+        results["shapes"][shape] = {
+            "graph": {"nodes": len(body["nodes"]), "edges": len(body["edges"])},
+            "endpoints": endpoints,
+            "server_peak_rss_mb": _peak_rss_mb(args.server_pid) if args.server_pid else None,
+        }
+        for name, stats in endpoints.items():
+            print(f"{shape:>8} {name:>16}: p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms, "
+                  f"{stats['requests_per_sec']} req/s")
+
+    results["client_peak_rss_mb"] = _peak_rss_mb()
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+        output.write("\n")
+    print(f"Results written to {args.output}")
+    return results
+
+
+def bench_compare(args):
+    """Print the change of every latency and throughput figure between two `suite` result files."""
+    with open(args.old) as old_file, open(args.new) as new_file:
+        old, new = json.load(old_file), json.load(new_file)
+    print(f"{old['meta'].get('revision')} -> {new['meta'].get('revision')}")
+    for shape, new_shape in new["shapes"].items():
+        old_shape = old["shapes"].get(shape)
+        if old_shape is None:
+            continue
+        for name, new_stats in new_shape["endpoints"].items():
+            old_stats = old_shape["endpoints"].get(name)
+            if old_stats is None:
+                continue
+            changes = [
+                f"{metric} {old_stats[metric]} -> {new_stats[metric]} ({(new_stats[metric] / old_stats[metric] - 1) * 100:+.1f}%)"
+                for metric in ("p50_ms", "p99_ms", "requests_per_sec") if old_stats[metric]
+            ]
+            print(f"{shape:>8} {name:>16}: " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GraphFlow performance benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subparsers.add_parser("ingest", help="Neo4j graph ingestion: per-row vs batched UNWIND")
+    ingest.add_argument("--nodes", type=int, default=10000)
+    ingest.add_argument("--batch-size", type=int, default=5000)
+    ingest.add_argument("--skip-row-by-row", action="store_true", help="Only time the batched path")
+    ingest.set_defaults(func=bench_ingest)
+
+    propagate = subparsers.add_parser("propagate", help="In-memory propagation: propagate_data vs ExecutionPlan")
+    propagate.add_argument("--nodes", type=int, default=50000)
+    propagate.add_argument("--fan-in", type=int, default=2, help="Max incoming edges per node (~nodes * fan_in edges)")
+    propagate.add_argument("--runs", type=int, default=10)
+    propagate.set_defaults(func=bench_propagate)
+
+    validate = subparsers.add_parser("validate", help="GraphSchema.validate_graph_structure on a large graph")
+    validate.add_argument("--nodes", type=int, default=100000)
+    validate.add_argument("--fan-in", type=int, default=2)
+    validate.set_defaults(func=bench_validate)
+
+    load = subparsers.add_parser("load", help="HTTP load test of a running API: requests/sec at N concurrent clients")
+    load.add_argument("--url", default="http://localhost:8000/api/graphs")
+    load.add_argument("--method", default="GET")
+    load.add_argument("--body", help="JSON request body, e.g. a GraphRunConfig for /run-graph")
+    load.add_argument("--clients", type=int, default=100)
+    load.add_argument("--seconds", type=float, default=30)
+    load.add_argument("--timeout", type=float, default=60)
+    load.set_defaults(func=bench_load)
+
+    suite = subparsers.add_parser("suite", help="Create, run and read latency of a running API on synthetic graphs")
+    suite.add_argument("--url", default="http://localhost:8000")
+    suite.add_argument("--shapes", nargs="+", choices=GRAPH_SHAPES, default=list(GRAPH_SHAPES))
+    suite.add_argument("--nodes", type=int, default=1000)
+    suite.add_argument("--fan-in", type=int, default=2, help="Max incoming edges per node of random graphs")
+    suite.add_argument("--keys", type=int, default=1, help="Data keys mapped along every edge")
+    suite.add_argument("--create-repeats", type=int, default=3)
+    suite.add_argument("--requests", type=int, default=50, help="Requests per run / read endpoint")
+    suite.add_argument("--clients", type=int, default=4)
+    suite.add_argument("--server-pid", type=int, help="Record the peak RSS of the API process (Linux)")
+    suite.add_argument("--timeout", type=float, default=300)
+    suite.add_argument("--output", default="bench_results.json")
+    suite.set_defaults(func=bench_suite)
+
+    compare = subparsers.add_parser("compare", help="Compare two suite result files")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    if not asyncio.iscoroutinefunction(args.func):
+        args.func(args)
+        return
+
+    async def run():
+        try:
+            await args.func(args)
+        finally:
+            await close_driver()
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
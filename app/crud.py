@@ -1,10 +1,61 @@
-from database import get_graphs_collection, get_nodes_collection, get_edges_collection
-from schemas import GraphSchema
-from neo4j_crud import create_graph_in_neo4j
+from database import (
+    get_client, get_graphs_collection, get_nodes_collection, get_edges_collection, supports_transactions,
+)
+from schemas import GraphSchema, NodeSchema, EdgeSchema, check_acyclic_and_connected
+from neo4j_crud import (
+    create_graph_in_neo4j, create_graph_node, create_nodes_batch, create_edges_batch, delete_graph_in_neo4j,
+    set_leaf_flags, node_row, edge_row,
+)
+from neo4j_database import get_driver
+from graph_cache import graph_cache
+from bson import ObjectId
+from starlette.concurrency import run_in_threadpool
+import os
+
+# Number of node / edge documents sent per insert_many call
+MONGO_INSERT_BATCH_SIZE = int(os.getenv("MONGO_INSERT_BATCH_SIZE", "1000"))
+# Unordered inserts let the server apply a batch in parallel; ordered stops at the first error
+MONGO_ORDERED_INSERTS = os.getenv("MONGO_ORDERED_INSERTS", "false").lower() == "true"
+# Number of streamed nodes / edges validated and buffered before they are flushed to both stores
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "5000"))
+
+
+async def _insert_in_batches(collection, documents, session=None):
+    """Insert `documents` with one insert_many call per MONGO_INSERT_BATCH_SIZE documents."""
+    for start in range(0, len(documents), MONGO_INSERT_BATCH_SIZE):
+        await collection.insert_many(
+            documents[start:start + MONGO_INSERT_BATCH_SIZE],
+            ordered=MONGO_ORDERED_INSERTS,
+            session=session,
+        )
+
+
+async def _insert_graph_documents(graph_data: GraphSchema, session=None):
+    """
+    Insert the graph, node and edge documents into MongoDB.
+
+    Node and edge documents carry the graph's id so that they can be queried and
+    rolled back together with a single delete_many per collection.
+    """
+    graph_id = str(graph_data.id)
+    await get_graphs_collection().insert_one(graph_data.dict(by_alias=True), session=session)
+
+    node_documents = [dict(node.dict(by_alias=True), graph_id=graph_id) for node in graph_data.nodes]
+    await _insert_in_batches(get_nodes_collection(), node_documents, session=session)
+
+    edge_documents = [dict(edge.dict(by_alias=True), graph_id=graph_id) for edge in graph_data.edges]
+    await _insert_in_batches(get_edges_collection(), edge_documents, session=session)
+
+
+async def _delete_graph_documents(graph_id: ObjectId):
+    """Remove every MongoDB document belonging to the graph (used for rollback)."""
+    await get_graphs_collection().delete_one({"_id": graph_id})
+    await get_nodes_collection().delete_many({"graph_id": str(graph_id)})
+    await get_edges_collection().delete_many({"graph_id": str(graph_id)})
 
 
 # ---- Graph CRUD Operations ---- #
-def create_graph(graph_data: GraphSchema):
+async def create_graph(graph_data: GraphSchema):
     """
     Creates a new graph in MongoDB and Neo4j after validating the graph's structure.
 
@@ -17,53 +68,194 @@ def create_graph(graph_data: GraphSchema):
     Purpose:
         This function validates the graph data structure, stores the graph, nodes, and edges in MongoDB,
         and synchronizes the data by creating the graph in Neo4j. If an error occurs during the process,
-        all MongoDB changes are rolled back to maintain data integrity.
+        the changes made in both MongoDB and Neo4j are rolled back to maintain data integrity.
+
+        Nodes and edges are written with chunked insert_many calls. On a replica set or sharded
+        cluster the MongoDB writes run inside a multi-document transaction that is only committed
+        once Neo4j succeeds, and the Neo4j graph is deleted if the transaction aborts; otherwise
+        rollback is a single delete_many per collection by graph id.
     """
     # Validate the structure before saving
-    if not GraphSchema.validate_graph_structure(graph_data):
+    if not await run_in_threadpool(GraphSchema.validate_graph_structure, graph_data):
         raise ValueError("Initial validation failed: The graph structure is invalid.")
 
-    # Initialize MongoDB collections
-    graphs_collection = get_graphs_collection()
-    nodes_collection = get_nodes_collection()
-    edges_collection = get_edges_collection()
-
-    # Track rollback data
-    node_ids = []
-    edge_ids = []
-    graph_id = None
+    if await supports_transactions():
+        # Aborting the transaction on any error leaves MongoDB untouched. It does not cover Neo4j,
+        # so whatever reached Neo4j (some batches, or the whole graph when the commit fails) is removed.
+        try:
+            async with get_client().start_session() as session:
+                async with await session.start_transaction():
+                    await _insert_graph_documents(graph_data, session=session)
+                    await create_graph_in_neo4j(graph_data)
+        except Exception as e:
+            print(f"Error occurred: {e}. Rolling back Neo4j changes.")
+            await delete_graph_in_neo4j(str(graph_data.id))
+            raise
+        graph_cache.invalidate(str(graph_data.id))
+        return str(graph_data.id)
 
     try:
-        # Step 1: Insert the graph document into MongoDB and capture its ID
-        graph_id = graphs_collection.insert_one(graph_data.dict(by_alias=True)).inserted_id
+        # Step 1: Insert the graph, node and edge documents into MongoDB in batches
+        await _insert_graph_documents(graph_data)
 
-        # Step 2: Insert each node into the nodes collection, excluding the graph_id attribute, and store its ID
-        for node in graph_data.nodes:
-            node_id = nodes_collection.insert_one(node.dict(by_alias=True, exclude={"graph_id"})).inserted_id
-            node_ids.append(node_id)
+        # Step 2: Create the graph in Neo4j if MongoDB operations are successful
+        await create_graph_in_neo4j(graph_data)
 
-        # Step 3: Insert each edge into the edges collection, excluding the graph_id attribute, and store its ID
-        for edge in graph_data.edges:
-            edge_id = edges_collection.insert_one(edge.dict(by_alias=True, exclude={"graph_id"})).inserted_id
-            edge_ids.append(edge_id)
+    except Exception as e:
+        print(f"Error occurred: {e}. Rolling back MongoDB and Neo4j changes.")
 
-        # Step 5: Create the graph in Neo4j if MongoDB operations are successful
-        create_graph_in_neo4j(graph_data)
+        # Rollback: If an error occurs, delete the inserted graph, nodes, and edges from MongoDB,
+        # and whatever Neo4j batches were already committed
+        await _delete_graph_documents(graph_data.id)
+        await delete_graph_in_neo4j(str(graph_data.id))
 
-    except Exception as e:
-        print(f"Error occurred: {e}. Rolling back MongoDB changes.")
-        
-        # Rollback: If an error occurs, delete the inserted graph, nodes, and edges from MongoDB
-        if graph_id:
-            graphs_collection.delete_one({"_id": graph_id})
-        for node_id in node_ids:
-            nodes_collection.delete_one({"_id": node_id})
-        for edge_id in edge_ids:
-            edges_collection.delete_one({"_id": edge_id})
-        
         # Re-raise the exception to propagate the error
         raise
 
-    return str(graph_id)  # Return the MongoDB graph ID as a string for further use
+    # Drop any compiled copy cached under this id before it is run
+    graph_cache.invalidate(str(graph_data.id))
+
+    return str(graph_data.id)  # Return the MongoDB graph ID as a string for further use
+
+
+# ---- Streaming graph creation ---- #
+class GraphStreamWriter:
+    """
+    Incrementally validates and stores a graph received as a stream of node and edge records.
+
+    All node records must come before the edge records. Records are validated as they arrive
+    and flushed to MongoDB and Neo4j in batches of `batch_size`, so memory holds one batch of
+    payloads plus a compact structural index (node ids, key types and edge endpoints as
+    integers) rather than the whole graph. Acyclicity and connectivity need the complete
+    edge set and are checked in `finish`. Edges are the single source of truth in this mode:
+    nodes carry no `paths_in` / `paths_out` copies.
+
+    Call `start`, then `add` for every record (flushing when `batch_ready`), then `finish`,
+    or `abort` to remove everything written so far.
+    """
+
+    def __init__(self, batch_size=STREAM_BATCH_SIZE):
+        self.graph_id = ObjectId()
+        self.batch_size = batch_size
+
+        # Structural index kept for the whole upload
+        self.node_index = {}  # node_id -> index
+        self.data_in_types = []  # index -> {key: type}
+        self.data_out_types = []  # index -> {key: type}
+        self.edge_src, self.edge_dst = [], []
+        self.edge_pairs = set()
+
+        # Payloads waiting to be flushed
+        self.pending_nodes = []
+        self.pending_edges = []
+        self._session = None
+
+    @property
+    def batch_ready(self):
+        """True when a full batch of nodes or edges is waiting to be flushed."""
+        return len(self.pending_nodes) >= self.batch_size or len(self.pending_edges) >= self.batch_size
+
+    async def start(self):
+        """Create the graph document in MongoDB and the Graph node in Neo4j, removing both if either write fails."""
+        try:
+            await get_graphs_collection().insert_one({"_id": self.graph_id, "streamed": True, "nodes": [], "edges": []})
+            self._session = get_driver().session()
+            await create_graph_node(self._session, str(self.graph_id))
+        except Exception:
+            await self.abort()
+            raise
+
+    def add(self, record):
+        """
+        Validate one record, `{"type": "node", ...NodeSchema fields}` or `{"type": "edge", ...EdgeSchema fields}`.
+
+        Raises:
+            ValueError: If the record is malformed or breaks a structural rule of the graph.
+        """
+        if not isinstance(record, dict):
+            raise ValueError("Each record must be a JSON object.")
+        record = dict(record)
+        record_type = record.pop("type", None)
+        if record_type == "node":
+            self._add_node(NodeSchema(**record))
+        elif record_type == "edge":
+            self._add_edge(EdgeSchema(**record))
+        else:
+            raise ValueError("Record type must be 'node' or 'edge'.")
+
+    def _add_node(self, node: NodeSchema):
+        if self.edge_src:
+            raise ValueError("All nodes must be sent before the first edge.")
+        if node.node_id in self.node_index:
+            raise ValueError("Each node_id within a graph must be unique.")
+        self.node_index[node.node_id] = len(self.node_index)
+        self.data_in_types.append({key: type(value) for key, value in node.data_in.items()})
+        self.data_out_types.append({key: type(value) for key, value in node.data_out.items()})
+        self.pending_nodes.append(node)
+
+    def _add_edge(self, edge: EdgeSchema):
+        # Check if edge references existing nodes
+        src = self.node_index.get(edge.src_node)
+        dst = self.node_index.get(edge.dst_node)
+        if src is None or dst is None:
+            raise ValueError("Edges must reference existing nodes in the graph.")
+
+        # Ensure there are no duplicate edges from the same source node to the same destination node
+        edge_pair = (src, dst)
+        if edge_pair in self.edge_pairs:
+            raise ValueError(f"Duplicate edge detected from {edge.src_node} to {edge.dst_node}.")
+        self.edge_pairs.add(edge_pair)
+
+        # Validate compatible data types for src_to_dst_data_keys
+        for src_key, dst_key in edge.src_to_dst_data_keys.items():
+            src_data_type = self.data_out_types[src].get(src_key, type(None))
+            dst_data_type = self.data_in_types[dst].get(dst_key, type(None))
+            if src_data_type != dst_data_type:
+                raise ValueError(f"Incompatible data types for key '{src_key}' in {edge.src_node} "
+                                 f"to key '{dst_key}' in {edge.dst_node}: {src_data_type} vs {dst_data_type}.")
+
+        self.edge_src.append(src)
+        self.edge_dst.append(dst)
+        self.pending_edges.append(edge)
+
+    async def flush(self):
+        """Write the pending nodes and edges to MongoDB and Neo4j, one batch per store and kind."""
+        graph_id = str(self.graph_id)
+        if self.pending_nodes:
+            nodes, self.pending_nodes = self.pending_nodes, []
+            await _insert_in_batches(get_nodes_collection(), [
+                dict(node.dict(by_alias=True, exclude={"paths_in", "paths_out"}), graph_id=graph_id) for node in nodes
+            ])
+            await create_nodes_batch(self._session, graph_id, [node_row(node) for node in nodes])
+        if self.pending_edges:
+            edges, self.pending_edges = self.pending_edges, []
+            await _insert_in_batches(get_edges_collection(), [
+                dict(edge.dict(by_alias=True), graph_id=graph_id) for edge in edges
+            ])
+            await create_edges_batch(self._session, graph_id, [edge_row(edge) for edge in edges])
+
+    async def finish(self):
+        """
+        Flush the last batch and run the whole-graph checks.
+
+        Returns:
+            dict: `graph_id` and the number of nodes and edges stored.
+        """
+        await self.flush()
+        check_acyclic_and_connected(len(self.node_index), self.edge_src, self.edge_dst)
+        await self._close_session()
+        # Leaves are only known once every edge has arrived
+        await set_leaf_flags(str(self.graph_id))
+        graph_cache.invalidate(str(self.graph_id))
+        return {"graph_id": str(self.graph_id), "nodes": len(self.node_index), "edges": len(self.edge_src)}
 
+    async def abort(self):
+        """Delete everything written for this graph from MongoDB and Neo4j."""
+        await self._close_session()
+        await _delete_graph_documents(self.graph_id)
+        await delete_graph_in_neo4j(str(self.graph_id))
 
+    async def _close_session(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
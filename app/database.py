@@ -1,17 +1,190 @@
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient, monitoring
+from pymongo.errors import PyMongoError
+from pymongo.write_concern import WriteConcern
+import asyncio
+import logging
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Constants
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("DB_NAME")
 
+# Connection pool tuning
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "majority")  # "majority" or a number of acknowledging nodes
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+MONGO_USE_TRANSACTIONS = os.getenv("MONGO_USE_TRANSACTIONS", "auto")  # "auto", "true" or "false"
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """
+    Collects connection checkout counts and wait times from the MongoDB client pool.
+
+    Checkouts are matched per asyncio task (per thread outside an event loop), since
+    every concurrent request of the async client waits on the same thread. A task cancelled
+    or timed out while waiting may get neither a checked-out nor a failed event, so waits of
+    finished tasks are dropped instead of being counted as waiters forever.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = {}  # waiter id -> (checkout start time, waiting asyncio task or None)
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checked_out = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def connection_check_out_started(self, event):
+        task = _current_task()
+        with self._lock:
+            self._drop_finished_waiters()
+            self._started[id(task) if task is not None else threading.get_ident()] = (time.perf_counter(), task)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            start, _ = self._started.pop(_waiter_id(), (None, None))
+            self.checkouts += 1
+            self.checked_out += 1
+            if start is not None:
+                wait_ms = (time.perf_counter() - start) * 1000
+                self.total_wait_ms += wait_ms
+                self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._started.pop(_waiter_id(), None)
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def _drop_finished_waiters(self):
+        """Forget waits whose task ended without a checked-out or failed event (caller holds the lock)."""
+        finished = [waiter for waiter, (_, task) in self._started.items() if task is not None and task.done()]
+        for waiter in finished:
+            del self._started[waiter]
+
+    def snapshot(self):
+        """Return a point-in-time copy of the collected metrics."""
+        with self._lock:
+            self._drop_finished_waiters()
+            return {
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "checked_out": self.checked_out,
+                "waiters": len(self._started),
+                "avg_wait_ms": self.total_wait_ms / self.checkouts if self.checkouts else 0.0,
+                "max_wait_ms": self.max_wait_ms,
+            }
+
+    # Remaining pool events are not needed for the metrics above
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+
+def _current_task():
+    """The running asyncio task, or None outside an event loop."""
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        return None
+
+
+def _waiter_id():
+    """Identify the waiter of a pool checkout: the current asyncio task, or the thread outside a loop."""
+    task = _current_task()
+    return id(task) if task is not None else threading.get_ident()
+
+
+# Process-wide client, created once by the application lifespan
+_client = None
+_pool_metrics = PoolMetricsListener()
+_supports_transactions = None
+
+
+def _write_concern():
+    """Parse MONGO_WRITE_CONCERN into a WriteConcern ("majority" or a node count)."""
+    w = int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN
+    return WriteConcern(w=w)
+
+
+def init_client():
+    """
+    Create the process-wide async MongoDB client (and its connection pool) if it does not exist yet.
+
+    The client connects lazily on its first operation and must then be used and closed on a single event loop.
+    """
+    global _client
+    if _client is None:
+        _client = AsyncMongoClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            event_listeners=[_pool_metrics],
+        )
+    return _client
+
+
+async def close_client():
+    """Close the process-wide MongoDB client and its monitor tasks."""
+    global _client, _supports_transactions
+    if _client is not None:
+        await _client.close()
+        _client = None
+        _supports_transactions = None
+
+
+def get_client():
+    """Return the shared MongoDB client, creating it lazily for scripts running outside the app lifespan."""
+    return init_client()
+
+
+async def supports_transactions():
+    """
+    Report whether multi-document transactions should be used.
+
+    Transactions require a replica set or sharded cluster, so with MONGO_USE_TRANSACTIONS=auto
+    the deployment type is probed once with a `hello` command and cached.
+    """
+    global _supports_transactions
+    if MONGO_USE_TRANSACTIONS.lower() in ("true", "false"):
+        return MONGO_USE_TRANSACTIONS.lower() == "true"
+    if _supports_transactions is None:
+        hello = await get_client().admin.command("hello")
+        _supports_transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+    return _supports_transactions
+
+
 def get_db():
-    """Establish a new MongoDB client connection and return the database object."""
-    client = MongoClient(MONGO_URI)
-    return client[DB_NAME]
+    """Return the database object from the shared MongoDB client, creating the client lazily."""
+    return get_client().get_database(DB_NAME, write_concern=_write_concern())
 
 def get_graphs_collection():
     """Retrieve the graphs collection from MongoDB."""
@@ -28,11 +201,34 @@ def get_edges_collection():
     db = get_db()
     return db["edges_collection"]
 
-def create_indexes():
-    """Create indexes for collections to optimize common queries."""
+def get_pool_metrics():
+    """
+    Report connection pool usage of the shared MongoDB client.
+
+    Returns:
+        dict: Checkout counts and wait times plus the configured limits.
+    """
+    metrics = _pool_metrics.snapshot()
+    metrics["max_pool_size"] = MONGO_MAX_POOL_SIZE
+    metrics["connected"] = _client is not None
+    return metrics
 
-    nodes_collection = get_nodes_collection()
-    nodes_collection.create_index([("graph_id", 1), ("node_id", 1)], unique=True)
+async def create_indexes():
+    """
+    Create indexes for collections to optimize common queries.
 
-    edges_collection = get_edges_collection()
-    edges_collection.create_index([("graph_id", 1), ("src_node", 1), ("dst_node", 1), ("edge_id", 1)], unique=True)
+    The unique indexes only cover documents that carry a `graph_id`. Node and edge documents written
+    before documents were tagged with their graph have none, would all be indexed as null, and would
+    collide on shared node ids; they cannot be attributed to a graph, so they are left out. A failed
+    index build is logged rather than stopping the application from starting.
+    """
+    tagged = {"graph_id": {"$exists": True}}
+    indexes = [
+        (get_nodes_collection(), [("graph_id", 1), ("node_id", 1)]),
+        (get_edges_collection(), [("graph_id", 1), ("src_node", 1), ("dst_node", 1), ("edge_id", 1)]),
+    ]
+    for collection, keys in indexes:
+        try:
+            await collection.create_index(keys, unique=True, partialFilterExpression=tagged)
+        except PyMongoError as e:
+            logger.error("Could not create index %s on %s: %s", keys, collection.name, e)
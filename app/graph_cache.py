@@ -0,0 +1,77 @@
+from collections import OrderedDict
+import os
+import threading
+
+# Total number of nodes + edges the cache may hold across all compiled graphs (0 disables caching)
+GRAPH_CACHE_MAX_SIZE = int(os.getenv("GRAPH_CACHE_MAX_SIZE", "1000000"))
+
+
+class GraphCache:
+    """
+    Per-process LRU cache of CompiledGraph objects keyed by graph_id.
+
+    Eviction is size-based: each entry costs its node + edge count and least recently
+    used graphs are dropped until the total fits in `max_size`.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, graph_id):
+        """Return the cached CompiledGraph for `graph_id`, or None on a miss."""
+        with self._lock:
+            compiled = self._entries.get(graph_id)
+            if compiled is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(graph_id)
+            self.hits += 1
+            return compiled
+
+    def put(self, compiled):
+        """Cache `compiled`, evicting least recently used graphs to stay within `max_size`."""
+        if compiled.size > self.max_size:
+            return  # Would evict everything and still not fit
+        with self._lock:
+            previous = self._entries.pop(compiled.graph_id, None)
+            if previous is not None:
+                self.size -= previous.size
+            self._entries[compiled.graph_id] = compiled
+            self.size += compiled.size
+            while self.size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+                self.evictions += 1
+
+    def invalidate(self, graph_id=None):
+        """Drop the entry for `graph_id`, or every entry when no graph_id is given."""
+        with self._lock:
+            if graph_id is None:
+                self._entries.clear()
+                self.size = 0
+                return
+            evicted = self._entries.pop(graph_id, None)
+            if evicted is not None:
+                self.size -= evicted.size
+
+    def stats(self):
+        """Return entry count, size and hit/miss/eviction counters."""
+        with self._lock:
+            return {
+                "graphs": len(self._entries),
+                "size": self.size,
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Process-wide cache shared by every request
+graph_cache = GraphCache(GRAPH_CACHE_MAX_SIZE)
@@ -0,0 +1,382 @@
+from collections import OrderedDict, deque
+from typing import List, NamedTuple
+import hashlib
+import json
+import threading
+import numpy as np
+
+# Number of enable/disable selections whose execution plans are kept per compiled graph
+MAX_PLANS_PER_GRAPH = 8
+
+
+# ---- Graph execution helpers ---- #
+
+class TopologicalSort(NamedTuple):
+    """Result of sorting an active subgraph, with the nodes a run would silently skip or starve."""
+
+    order: List[str]  # Node ids in topological order
+    cycle_nodes: List[str]  # Nodes on a cycle or downstream of one; never ordered nor executed
+    unreachable_nodes: List[str]  # Nodes with incoming edges in the graph, none of them from an active node
+
+
+def apply_inputs_and_overwrites(nodes_data, root_inputs, data_overwrites):
+    # - Applying root inputs involves iterating over each node in root_inputs.
+    # - Time complexity: O(|R|), where |R| is the number of nodes with root inputs.
+
+    # - Applying data overwrites also involves updating specific nodes.
+    # - Time complexity: O(|D|), where |D| is the number of nodes with data overwrites.
+    for node_id, inputs in root_inputs.items():
+        if node_id in nodes_data:
+            nodes_data[node_id]["data_in"].update(inputs)
+    for node_id, overwrites in data_overwrites.items():
+        if node_id in nodes_data:
+            nodes_data[node_id]["data_in"].update(overwrites)
+
+def sweep_columns(columns):
+    """
+    Convert parameter-sweep input columns, `{node_id: {key: [value per point]}}`, into NumPy arrays.
+
+    Returns:
+        tuple: (the columns as 1-D arrays in the same nested layout, number of sweep points).
+
+    Raises:
+        ValueError: If a column is empty or not numeric, or the columns differ in length.
+    """
+    arrays = {}
+    points = None
+    for node_id, inputs in columns.items():
+        arrays[node_id] = {}
+        for key, values in inputs.items():
+            column = np.asarray(values)
+            if column.ndim != 1 or column.size == 0 or column.dtype.kind not in "iuf":
+                raise ValueError(f"Column '{key}' of {node_id} must be a non-empty list of numbers.")
+            if points is not None and column.size != points:
+                raise ValueError(f"Column '{key}' of {node_id} has {column.size} values, expected {points}.")
+            points = column.size
+            arrays[node_id][key] = column
+    if points is None:
+        raise ValueError("A sweep needs at least one input column.")
+    return arrays, points
+
+
+# ---- Compiled graph ---- #
+
+class CompiledGraph:
+    """
+    Parsed, run-ready representation of a stored graph.
+
+    Built once from the full graph fetched from Neo4j and shared by every run of it:
+    node ids are interned to integer indexes, outgoing edges are stored in CSR form
+    (`out_offsets` / `out_edges`), key mappings are pre-parsed, and the topological
+    order of the full graph is precomputed. Instances must be treated as read-only.
+    """
+
+    def __init__(self, graph_id, nodes_data, edges_data):
+        self.graph_id = graph_id
+        self.node_ids = list(nodes_data)  # index -> node_id
+        self.node_index = {node_id: index for index, node_id in enumerate(self.node_ids)}
+        self.data_in = [nodes_data[node_id]["data_in"] for node_id in self.node_ids]
+        self.data_out = [nodes_data[node_id]["data_out"] for node_id in self.node_ids]
+
+        # Edges whose endpoints are both known, in their original order
+        self.edges = [
+            edge for edge in edges_data
+            if edge["src"] in self.node_index and edge["dst"] in self.node_index
+        ]
+        self.edge_src = [self.node_index[edge["src"]] for edge in self.edges]
+        self.edge_dst = [self.node_index[edge["dst"]] for edge in self.edges]
+        self.key_mappings = [list(edge["src_to_dst_data_keys"].items()) for edge in self.edges]
+
+        # CSR adjacency: out_edges[out_offsets[i]:out_offsets[i + 1]] are the edge indexes leaving node i,
+        # kept in their original order so propagation matches the adjacency-list implementation
+        counts = [0] * (len(self.node_ids) + 1)
+        for src in self.edge_src:
+            counts[src + 1] += 1
+        for index in range(len(self.node_ids)):
+            counts[index + 1] += counts[index]
+        self.out_offsets = counts
+        self.out_edges = [0] * len(self.edges)
+        cursor = counts[:-1]
+        for edge_index, src in enumerate(self.edge_src):
+            self.out_edges[cursor[src]] = edge_index
+            cursor[src] += 1
+
+        full_sort = self._kahn(range(len(self.node_ids)))
+        self.topo_order = full_sort.order
+        self.cycle_nodes = full_sort.cycle_nodes
+
+        # Execution plans per enable/disable selection, least recently used first
+        self._plans = OrderedDict()
+        self._plans_lock = threading.Lock()
+        self._version = None
+
+    @property
+    def version(self):
+        """
+        Content hash of the graph's nodes, data and edges, computed on first use.
+
+        Identifies what a run of this graph would compute, so results keyed by it go stale
+        automatically if the graph stored under `graph_id` is ever replaced.
+        """
+        if self._version is None:
+            content = json.dumps(
+                [self.node_ids, self.data_in, self.data_out, self.edge_src, self.edge_dst, self.key_mappings],
+                sort_keys=True, separators=(",", ":"), default=str,
+            )
+            self._version = hashlib.sha256(content.encode()).hexdigest()
+        return self._version
+
+    @property
+    def size(self):
+        """Number of nodes plus edges, used as the cache cost of this graph."""
+        return len(self.node_ids) + len(self.edges)
+
+    def active_nodes(self, enable_list, disable_list):
+        """Return the node indexes selected by `enable_list` / `disable_list`, or None for the full graph."""
+        if enable_list:
+            wanted = set(enable_list)
+            return [index for index, node_id in enumerate(self.node_ids) if node_id in wanted]
+        if disable_list:
+            unwanted = set(disable_list)
+            return [index for index, node_id in enumerate(self.node_ids) if node_id not in unwanted]
+        return None
+
+    def subgraph(self, active=None):
+        """
+        Materialize per-run `nodes_data` / `edges_data` for the active nodes.
+
+        The data dictionaries are copied so that a run can apply inputs and propagate
+        values without touching the cached base data.
+        """
+        indexes = range(len(self.node_ids)) if active is None else active
+        nodes_data = {
+            self.node_ids[index]: {"data_in": dict(self.data_in[index]), "data_out": dict(self.data_out[index])}
+            for index in indexes
+        }
+        if active is None:
+            edges_data = list(self.edges)
+        else:
+            edges_data = [edge for edge in self.edges if edge["src"] in nodes_data and edge["dst"] in nodes_data]
+        return nodes_data, edges_data
+
+    def topological_sort(self, active=None):
+        """TopologicalSort of the active subgraph, including the nodes it cannot order or feed."""
+        if active is None:
+            return TopologicalSort(list(self.topo_order), list(self.cycle_nodes), [])
+        return self._kahn(active)
+
+    def downstream(self, node_ids, active=None):
+        """
+        Indexes of the active nodes reachable from `node_ids` (the nodes themselves included), in index order.
+
+        This is the cone of nodes whose inputs can change when the inputs of `node_ids` change.
+        Node ids that are unknown or inactive are ignored.
+        """
+        is_active = [active is None] * len(self.node_ids)
+        if active is not None:
+            for index in active:
+                is_active[index] = True
+        seen = [False] * len(self.node_ids)
+        stack = []
+        for node_id in node_ids:
+            index = self.node_index.get(node_id)
+            if index is not None and is_active[index] and not seen[index]:
+                seen[index] = True
+                stack.append(index)
+        while stack:
+            src = stack.pop()
+            for position in range(self.out_offsets[src], self.out_offsets[src + 1]):
+                dst = self.edge_dst[self.out_edges[position]]
+                if is_active[dst] and not seen[dst]:
+                    seen[dst] = True
+                    stack.append(dst)
+        return [index for index, reached in enumerate(seen) if reached]
+
+    def unknown_nodes(self, enable_list, disable_list):
+        """Node ids named in `enable_list` / `disable_list` that do not exist in this graph."""
+        return [node_id for node_id in (enable_list or disable_list or []) if node_id not in self.node_index]
+
+    def execution_plan(self, enable_list=(), disable_list=()):
+        """Return the ExecutionPlan of the subgraph selected by the lists, compiling it on first use."""
+        key = ("enable", frozenset(enable_list)) if enable_list else (
+            ("disable", frozenset(disable_list)) if disable_list else None
+        )
+        with self._plans_lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                return plan
+        plan = ExecutionPlan(self, self.active_nodes(enable_list, disable_list))
+        plan.unknown_nodes = self.unknown_nodes(enable_list, disable_list)
+        with self._plans_lock:
+            self._plans[key] = plan
+            while len(self._plans) > MAX_PLANS_PER_GRAPH:
+                self._plans.popitem(last=False)
+        return plan
+
+    def _kahn(self, active):
+        """
+        Kahn's algorithm over the CSR adjacency restricted to the `active` node indexes.
+
+        The same O(V + E) pass also finds the nodes left with a non-zero in-degree (cycles)
+        and the active nodes whose every predecessor is inactive (unreachable).
+        """
+        active = list(active)
+        is_active = [False] * len(self.node_ids)
+        for index in active:
+            is_active[index] = True
+        in_degree = [0] * len(self.node_ids)
+        has_predecessor = [False] * len(self.node_ids)
+        for src, dst in zip(self.edge_src, self.edge_dst):
+            if is_active[dst]:
+                has_predecessor[dst] = True
+                if is_active[src]:
+                    in_degree[dst] += 1
+        unreachable_nodes = [
+            self.node_ids[index] for index in active if has_predecessor[index] and in_degree[index] == 0
+        ]
+
+        zero_in_degree = deque(index for index in active if in_degree[index] == 0)
+        topo_order = []
+        while zero_in_degree:
+            src = zero_in_degree.popleft()
+            topo_order.append(self.node_ids[src])
+            for position in range(self.out_offsets[src], self.out_offsets[src + 1]):
+                dst = self.edge_dst[self.out_edges[position]]
+                if not is_active[dst]:
+                    continue
+                in_degree[dst] -= 1
+                if in_degree[dst] == 0:
+                    zero_in_degree.append(dst)
+
+        cycle_nodes = [self.node_ids[index] for index in active if in_degree[index] > 0]
+        return TopologicalSort(topo_order, cycle_nodes, unreachable_nodes)
+
+
+# ---- Execution plan ---- #
+
+class ExecutionPlan:
+    """
+    Array-backed propagation program for one active subgraph of a CompiledGraph.
+
+    Every (node, key) value touched by propagation is interned to an integer slot in a
+    flat value array: `data_out` values read along an edge become source slots and
+    `data_in` keys written along an edge become destination slots. Each key mapping is
+    lowered to a (src_slot, dst_slot) copy instruction, ordered by the topological order
+    and edge order, so a run is a single loop over `instructions` followed by writing the
+    destination slots back into `data_in`. Produces the same result as `benchmark.propagate_data`.
+
+    Nodes that cannot be ordered (`cycle_nodes`) are reported rather than silently skipped,
+    so callers can fail the run or record it as partial.
+    """
+
+    NONE_SLOT = 0  # Holds None, the value read for a source key missing from data_out
+
+    def __init__(self, compiled, active=None):
+        self.active = active
+        sort = compiled.topological_sort(active)
+        self.topo_order = sort.order
+        self.cycle_nodes = sort.cycle_nodes  # Skipped by the plan: not ordered, so never propagated from
+        self.unreachable_nodes = sort.unreachable_nodes
+        self.unknown_nodes = []  # Set by CompiledGraph.execution_plan
+
+        is_active = [active is None] * len(compiled.node_ids)
+        if active is not None:
+            for index in active:
+                is_active[index] = True
+
+        initial_values = [None]
+        src_slots = {}  # (node index, data_out key) -> slot
+        dst_slots = {}  # (node index, data_in key) -> slot
+        self.instructions = []
+        for node_id in self.topo_order:
+            src = compiled.node_index[node_id]
+            data_out = compiled.data_out[src]
+            for position in range(compiled.out_offsets[src], compiled.out_offsets[src + 1]):
+                edge_index = compiled.out_edges[position]
+                dst = compiled.edge_dst[edge_index]
+                if not is_active[dst]:
+                    continue
+                for src_key, dst_key in compiled.key_mappings[edge_index]:
+                    src_slot = src_slots.get((src, src_key))
+                    if src_slot is None:
+                        if src_key in data_out:
+                            src_slot = src_slots[(src, src_key)] = len(initial_values)
+                            initial_values.append(data_out[src_key])
+                        else:
+                            src_slot = self.NONE_SLOT
+                    dst_slot = dst_slots.get((dst, dst_key))
+                    if dst_slot is None:
+                        dst_slot = dst_slots[(dst, dst_key)] = len(initial_values)
+                        initial_values.append(None)
+                    self.instructions.append((src_slot, dst_slot))
+        self.initial_values = initial_values
+
+        # Write-back table: (node_id, data_in key, slot), in slot order so that keys new to a
+        # node's data_in are inserted in the order propagation first writes them
+        self.outputs = [(compiled.node_ids[node], key, slot) for (node, key), slot in dst_slots.items()]
+        self._by_node = None  # node_id -> (instructions, outputs), built on the first execute_nodes
+
+    @property
+    def is_complete(self):
+        """True when every active node is ordered, i.e. a run computes the whole subgraph."""
+        return not self.cycle_nodes
+
+    def issues(self):
+        """Offending nodes of this selection: cycles, unreachable nodes and unknown node ids."""
+        return {
+            "cycle_nodes": self.cycle_nodes,
+            "unreachable_nodes": self.unreachable_nodes,
+            "unknown_nodes": self.unknown_nodes,
+        }
+
+    def execute(self, nodes_data):
+        """Propagate values along every edge and write the results into `nodes_data[...]["data_in"]`."""
+        self.write_back(self.propagate(), nodes_data)
+
+    def execute_nodes(self, nodes_data):
+        """
+        Same result as `execute` for the nodes in `nodes_data`, which may hold any subset of the active nodes.
+
+        Source slots are never written, so each node's inputs only depend on the instructions that
+        write them: only those are run, and the cost is proportional to the nodes given rather than
+        to the whole plan.
+        """
+        by_node = self._by_node
+        if by_node is None:
+            by_node = {}
+            slot_node = {}
+            for node_id, key, slot in self.outputs:
+                slot_node[slot] = node_id
+                by_node.setdefault(node_id, ([], []))[1].append((node_id, key, slot))
+            for instruction in self.instructions:
+                by_node[slot_node[instruction[1]]][0].append(instruction)
+            self._by_node = by_node
+
+        values = self.initial_values
+        for node_id in nodes_data:
+            instructions, outputs = by_node.get(node_id, ((), ()))
+            written = {}
+            for src_slot, dst_slot in instructions:
+                written[dst_slot] = values[src_slot]
+            data_in = nodes_data[node_id]["data_in"]
+            for _, key, slot in outputs:
+                data_in[key] = written[slot]
+
+    def propagate(self):
+        """
+        Run the copy instructions and return the final value array.
+
+        Propagation only reads `data_out`, which runs never modify, so the array depends on the
+        plan alone and can be written back into any number of runs of the same selection.
+        """
+        values = self.initial_values.copy()
+        for src_slot, dst_slot in self.instructions:
+            values[dst_slot] = values[src_slot]
+        return values
+
+    def write_back(self, values, nodes_data):
+        """Copy the destination slots into the `data_in` dictionaries of `nodes_data`."""
+        for node_id, key, slot in self.outputs:
+            nodes_data[node_id]["data_in"][key] = values[slot]
+
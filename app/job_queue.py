@@ -0,0 +1,159 @@
+import asyncio
+from collections import OrderedDict
+import os
+import threading
+import time
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Background run jobs of /run-graph ("background": true)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # Jobs executed concurrently per process
+JOB_QUEUE_MAX_SIZE = int(os.getenv("JOB_QUEUE_MAX_SIZE", "100"))  # Queued jobs before submissions are rejected
+JOB_STATUS_RETENTION = int(os.getenv("JOB_STATUS_RETENTION", "10000"))  # Job statuses kept in memory
+JOB_DRAIN_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT", "30"))  # Seconds shutdown waits for queued jobs
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue already holds JOB_QUEUE_MAX_SIZE jobs."""
+
+
+class InMemoryJobStore:
+    """
+    Local job status backend keeping the most recent `max_jobs` statuses in this process.
+
+    Any object with the same `create` / `update` / `get` methods can be passed to JobQueue,
+    e.g. to share statuses between workers through an external store.
+    """
+
+    def __init__(self, max_jobs=JOB_STATUS_RETENTION):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, job_id, **fields):
+        """Record a new job, dropping the oldest statuses beyond `max_jobs`."""
+        with self._lock:
+            self._jobs[job_id] = dict(fields, job_id=job_id)
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+    def update(self, job_id, **fields):
+        """Merge `fields` into the status of `job_id` (ignored if it was already dropped)."""
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        """Return a copy of the status of `job_id`, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+
+class JobQueue:
+    """
+    Bounded asyncio queue of jobs executed by `workers` background tasks.
+
+    Coroutine functions are awaited on the event loop; plain functions run in the thread pool
+    so they never block it. The queue depth is capped at `max_size`: submissions beyond it
+    raise QueueFullError instead of waiting, so callers can push back on clients. Statuses go
+    through `store`: "queued", "running", then the status returned by the job ("complete"
+    unless the job returns a dict with a `status`) or "failed" with the error.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_size=JOB_QUEUE_MAX_SIZE, store=None):
+        self.workers = workers
+        self.max_size = max_size
+        self.store = store if store is not None else InMemoryJobStore()
+        self._queue = asyncio.Queue(maxsize=max_size)
+        self._tasks = []
+        self.running = 0
+
+    def start(self):
+        """Start the worker tasks on the running event loop."""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout=JOB_DRAIN_TIMEOUT):
+        """Wait up to `timeout` seconds for queued jobs to finish, then cancel the workers."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job_id, func, *args):
+        """
+        Queue `func(*args)` under `job_id`.
+
+        Raises:
+            QueueFullError: If `max_size` jobs are already waiting.
+        """
+        try:
+            self._queue.put_nowait((job_id, func, args))
+        except asyncio.QueueFull:
+            raise QueueFullError(f"The job queue is full ({self.max_size} jobs waiting).") from None
+        self.store.create(job_id, status="queued", submitted_at=time.time())
+
+    def status(self, job_id):
+        """Return the status record of `job_id`, or None if unknown."""
+        return self.store.get(job_id)
+
+    def stats(self):
+        """Return the queue depth, running jobs and configured limits."""
+        return {
+            "queued": self._queue.qsize(),
+            "running": self.running,
+            "workers": self.workers,
+            "max_size": self.max_size,
+        }
+
+    async def _worker(self):
+        while True:
+            job_id, func, args = await self._queue.get()
+            self.running += 1
+            self.store.update(job_id, status="running", started_at=time.time())
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    result = await func(*args)
+                else:
+                    result = await run_in_threadpool(func, *args)
+            except Exception as e:
+                self.store.update(job_id, status="failed", error=getattr(e, "detail", None) or str(e),
+                                  finished_at=time.time())
+            else:
+                status = result.get("status", "complete") if isinstance(result, dict) else "complete"
+                self.store.update(job_id, status=status, result=result, finished_at=time.time())
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+
+
+# Process-wide queue, created once by the application lifespan
+_job_queue = None
+
+
+def init_job_queue():
+    """Create the process-wide job queue and start its workers (requires a running event loop)."""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+        _job_queue.start()
+    return _job_queue
+
+
+async def close_job_queue():
+    """Drain and stop the process-wide job queue."""
+    global _job_queue
+    if _job_queue is not None:
+        await _job_queue.stop()
+        _job_queue = None
+
+
+def get_job_queue():
+    """Return the process-wide job queue."""
+    return init_job_queue()
@@ -1,13 +1,30 @@
-from fastapi import FastAPI, HTTPException
-from schemas import GraphSchema, GraphRunConfig, NodeOutputRequest, LeafOutputRequest
-from neo4j import GraphDatabase
-from fastapi.responses import JSONResponse
-from crud import (
-    create_graph,
+from fastapi import FastAPI, HTTPException, Depends, Request, Query
+from schemas import (
+    GraphSchema, GraphRunConfig, GraphRunBatchConfig, GraphSweepConfig, NodeOutputRequest, LeafOutputRequest,
 )
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from crud import GraphStreamWriter
+from neo4j_database import (
+    init_driver, close_driver, get_driver, get_pool_metrics, create_constraints, check_index_usage,
+)
+from storage import STORAGE_BACKEND, run_config_json
+from neo4j_storage import Neo4jStorage
+from memory_storage import memory_storage
+from database import init_client, close_client, create_indexes, get_pool_metrics as get_mongo_pool_metrics
+from graph_engine import CompiledGraph, apply_inputs_and_overwrites, sweep_columns
+from graph_cache import graph_cache
+from run_memo import run_memo, memo_key
+from job_queue import init_job_queue, close_job_queue, get_job_queue, QueueFullError
+from metrics import MetricsMiddleware, METRICS_ENABLED, stage, observe_run, render_metrics, count_queries
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
+import base64
 import json
-from uuid import uuid4
+import numpy as np
 import os
+import time
+from uuid import uuid4
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -17,12 +34,56 @@ from fastapi.middleware.cors import CORSMiddleware
 load_dotenv()
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create the shared database drivers and schema indexes on startup and close the drivers on shutdown.
+
+    The memory storage backend needs neither, so no database connection is made.
+    """
+    databases = STORAGE_BACKEND != "memory"
+    if databases:
+        init_driver()
+        init_client()
+        await create_constraints()
+        await check_index_usage()
+        await create_indexes()
+    init_job_queue()
+    yield
+    await close_job_queue()
+    if databases:
+        await close_client()
+        await close_driver()
+
+
+@asynccontextmanager
+async def open_storage():
+    """
+    Storage selected by STORAGE_BACKEND: the process-wide in-memory store, or a Neo4jStorage on a
+    session borrowed from the shared driver (its queries counted in the request metrics).
+    """
+    if STORAGE_BACKEND == "memory":
+        yield memory_storage
+        return
+    async with get_driver().session() as session:
+        yield Neo4jStorage(count_queries(session))
+
+
+async def get_storage():
+    """FastAPI dependency yielding the storage used by a request."""
+    async with open_storage() as storage:
+        yield storage
+
 
+app = FastAPI(lifespan=lifespan)
 
-neo4j_uri = os.getenv("neo4j_uri")
-neo4j_user = os.getenv("neo4j_user")
-neo4j_password = os.getenv("neo4j_password")
+
+# Largest page size of /api/graphs/{graph_id} and largest id list of /api/graphs/{graph_id}/nodes
+GRAPH_PAGE_MAX_LIMIT = int(os.getenv("GRAPH_PAGE_MAX_LIMIT", "10000"))
+# Longest chain of incremental re-runs reading outputs through their base runs before a full re-run is forced
+RERUN_MAX_LINEAGE = int(os.getenv("RERUN_MAX_LINEAGE", "8"))
+# Largest number of input vectors accepted by /run-graph/sweep
+SWEEP_MAX_POINTS = int(os.getenv("SWEEP_MAX_POINTS", "100000"))
 
 
 app.add_middleware(
@@ -31,13 +92,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Request, stage and Cypher metrics for /metrics (and the Server-Timing header)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 
 #End point to get all the graphs
 
 @app.get("/api/graphs")
-async def get_all_graphs():
+async def get_all_graphs(storage=Depends(get_storage)):
     """
      Time Complexity Analysis:
         Neo4j Query (Cypher): O(G), where V is the number of nodes with the label `Graph`, as it retrieves each `graph_id` node individually.
@@ -47,170 +113,196 @@ async def get_all_graphs():
         O(V), as it stores the `graph_id` of each `Graph` node in the `graphs` list.
     """
 
-    #Connecting to the Neo4j database
-    driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-
     #Fetching all the graph_ids from the database
-    with driver.session() as session:
-        result = session.run("MATCH (g:Graph) RETURN g.graph_id AS graph_id")
-        graphs = [{"graph_id": record["graph_id"]} for record in result]
+    graphs = [{"graph_id": graph_id} for graph_id in await storage.list_graphs()]
     return graphs
 
 
 # Endpoint to get a specific graph
 
 @app.get("/api/graphs/{graph_id}")
-async def get_graph(graph_id: str):
+async def get_graph(
+    graph_id: str,
+    fields: Literal["full", "ids"] = "full",
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    storage=Depends(get_storage),
+):
     # Time Complexity Analysis:
     # Neo4j Query (Cypher):
     #   - Nodes Query: O(V), where V is the number of nodes with the specified `graph_id` and valid `node_id`.
     #   - Edges Query: O(E), where E is the number of edges between nodes with the specified `graph_id`.
+    #   - A page reads O(limit) nodes from the (graph_id, node_id) index plus their outgoing edges.
     # Overall Algorithm: O(V + E), as we need to retrieve both nodes and edges for the specified `graph_id`.
     #
     # Space Complexity Analysis:
-    # O(V + E), where V is the number of nodes and E is the number of edges. Space is used to store `nodes_data` and `edges_data` lists.
+    # O(V + E) for a full response, O(limit + edges of the page) for a page, O(1) per record when streaming.
 
     """
     Endpoint to retrieve graph data based on a specified graph ID.
     
     Args:
         graph_id (str): Unique identifier for the graph to be retrieved.
+        fields (str): "full" for node payloads and edge key mappings, or "ids" for the topology only
+                      (node `id`s and edge `src` / `dst`).
+        limit (int): Page size. When set, the response holds up to `limit` nodes (ordered by node ID) together
+                     with their outgoing edges, and `next_cursor` to fetch the next page (null on the last one).
+        cursor (str): `next_cursor` of the previous page.
+        stream (bool): Stream the whole graph as one JSON document while it is read from Neo4j, instead of
+                       building the response in memory (`limit` / `cursor` are ignored).
     
     Response:
         JSONResponse: A JSON object containing two main keys:
             - nodes: List of nodes in the graph, each with `id`, `data_in`, and `data_out`.
             - edges: List of edges between nodes, each with `src`, `dst`, and `src_to_dst_data_keys`.
+            - next_cursor: Only for paginated requests.
     
     Purpose:
         This function connects to a Neo4j database to retrieve and structure graph data, 
         including nodes and edges, for use in front-end applications (e.g., ForceGraph3D).
+        Large graphs can be fetched as topology pages, with node payloads loaded on demand
+        from `/api/graphs/{graph_id}/nodes`.
     """
-    driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-    with driver.session() as session:
-        # Fetch nodes with a valid node_id
-        nodes_query = """
-        MATCH (n {graph_id: $graph_id}) 
-        WHERE n.node_id IS NOT NULL
-        RETURN n.node_id AS node_id, n.data_in AS data_in, n.data_out AS data_out
-        """
-        nodes = session.run(nodes_query, {"graph_id": graph_id})
-        
-        # Convert nodes result to a list
-        nodes_data = [
-            {
-                "id": record["node_id"],  # Use "id" for compatibility with ForceGraph3D
-                "data_in": json.loads(record["data_in"]) if record["data_in"] else {},
-                "data_out": json.loads(record["data_out"]) if record["data_out"] else {}
-            }
-            for record in nodes
-        ]
-
-        # Fetch edges
-        edges_query = """
-        MATCH (src {graph_id: $graph_id})-[r]->(dst {graph_id: $graph_id})
-        WHERE src.node_id IS NOT NULL AND dst.node_id IS NOT NULL
-        RETURN src.node_id AS src, dst.node_id AS dst, r.src_to_dst_data_keys AS src_to_dst_data_keys
-        """
-        edges = session.run(edges_query, {"graph_id": graph_id})
-        
-        # Convert edges result to a list
-        edges_data = [
-            {
-                "src": record["src"],
-                "dst": record["dst"],
-                "src_to_dst_data_keys": json.loads(record["src_to_dst_data_keys"]) if record["src_to_dst_data_keys"] else {}
-            }
-            for record in edges
-        ]
+    full = fields == "full"
+    if stream:
+        return StreamingResponse(stream_graph(graph_id, full), media_type="application/json")
+    if limit is not None:
+        return await get_graph_page(storage, graph_id, full, min(limit, GRAPH_PAGE_MAX_LIMIT), cursor)
+
+    # Fetch nodes with a valid node_id
+    nodes_data = [node async for node in storage.graph_nodes(graph_id, full)]
+
+    # Fetch edges
+    edges_data = [edge async for edge in storage.graph_edges(graph_id, full)]
     
     # Return a structured response suitable for the frontend
     return JSONResponse(content={"nodes": nodes_data, "edges": edges_data})
 
+
+@app.get("/api/graphs/{graph_id}/nodes")
+async def get_graph_nodes(graph_id: str, ids: List[str] = Query(...), storage=Depends(get_storage)):
+    """
+    Endpoint to load the payloads of selected nodes of a graph, e.g. after fetching its topology with `fields=ids`.
+
+    Args:
+        graph_id (str): Unique identifier of the graph.
+        ids (list): Node IDs to load (repeat the parameter: `?ids=a&ids=b`), at most GRAPH_PAGE_MAX_LIMIT.
+
+    Response:
+        JSON object containing:
+            - nodes: The nodes found, each with `id`, `data_in`, and `data_out`.
+    """
+    if len(ids) > GRAPH_PAGE_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {GRAPH_PAGE_MAX_LIMIT} node IDs can be requested at once.")
+    return {"nodes": [node async for node in storage.graph_nodes(graph_id, True, ids)]}
+
+
+def encode_cursor(node_id):
+    """Opaque pagination cursor pointing after `node_id`."""
+    return base64.urlsafe_b64encode(json.dumps({"after": node_id}).encode()).decode()
+
+def decode_cursor(cursor):
+    """Node ID encoded by `encode_cursor`, or None for the first page."""
+    if cursor is None:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))["after"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+async def get_graph_page(storage, graph_id, full, limit, cursor):
+    """
+    One page of a graph: up to `limit` nodes in node ID order after the cursor, each with its outgoing edges.
+
+    Every edge is returned with its source node, so reading all pages yields every node and edge once.
+    """
+    nodes_data, edges_data = await storage.graph_page(graph_id, full, decode_cursor(cursor), limit)
+    next_cursor = encode_cursor(nodes_data[-1]["id"]) if len(nodes_data) == limit else None
+    return JSONResponse(content={"nodes": nodes_data, "edges": edges_data, "next_cursor": next_cursor})
+
+async def stream_graph(graph_id, full, chunk_size=1000):
+    """
+    Yield the `{"nodes": [...], "edges": [...]}` document of a graph, `chunk_size` entries at a time.
+
+    Opens its own storage since the response body is produced after the request dependencies close.
+    """
+    async with open_storage() as storage:
+        for section, entries in (
+            ('{"nodes":[', storage.graph_nodes(graph_id, full)),
+            ('],"edges":[', storage.graph_edges(graph_id, full)),
+        ):
+            yield section
+            chunk = []
+            first = True
+            async for entry in entries:
+                chunk.append(json.dumps(entry))
+                if len(chunk) == chunk_size:
+                    yield ("" if first else ",") + ",".join(chunk)
+                    chunk, first = [], False
+            if chunk:
+                yield ("" if first else ",") + ",".join(chunk)
+        yield "]}"
+
+
 @app.get("/output/{run_id}")
-async def get_graph_output(run_id: str):
+async def get_graph_output(run_id: str, node_ids: Optional[List[str]] = Query(None),
+                           storage=Depends(get_storage)):
     # Time Complexity Analysis:
-    # Neo4j Query (Cypher):
-    #   - Nodes Query: O(V), where V is the number of nodes with the specified `run_id` in the `OUTPUT` relationship.
-    #   - Edges Query: O(E), where E is the number of edges connecting nodes associated with the specified `run_id`.
-    #   - Topo Order Query: O(1), since it only retrieves a single attribute (`topo_order`) from the `Run` node.
-    # Overall Algorithm: O(V + E), as we retrieve both nodes and edges and a single value for `topo_order`.
+    # Neo4j Query (Cypher), a single round trip:
+    #   - Run lookup: O(1) through the run_id constraint.
+    #   - Nodes: O(L * V), where V is the number of nodes of the run and L the length of its lineage
+    #     (1 for a full run); each node keeps the OUTPUT of the nearest run of the lineage.
+    #   - Edges: O(E), where E is the number of edges connecting nodes of the run.
+    # Overall Algorithm: O(L * V + E).
     #
     # Space Complexity Analysis:
-    # O(V + E), where V is the number of nodes and E is the number of edges. Space is used to store `nodes_data`, `edges_data`, and `topo_order`.
+    # O(V + E), where V is the number of nodes and E is the number of edges returned.
 
     """
     Endpoint to retrieve output data for all nodes and edges associated with a specified run ID.
     
     Args:
         run_id (str): Unique identifier for the run whose output data is to be retrieved.
+        node_ids (List[str], optional): Repeated query parameter restricting the response to these nodes
+                                        and the edges between them.
     
     Response:
         JSON object containing:
             - run_id: The requested run ID.
+            - status: "complete", or "partial" if the run skipped nodes on a cycle.
             - topo_order: List of node IDs in topological order for the run.
             - nodes: List of nodes with fields `id`, `data_in`, and `data_out`.
             - edges: List of edges with fields `src`, `dst`, `edge_id`, and `src_to_dst_data_keys`.
+            - points: For a sweep run, the number of sweep points; `data_in` then holds one list of
+                      values per swept key.
     
     Purpose:
-        This function connects to a Neo4j database to retrieve output data for nodes and edges
-        based on a specific `run_id`, including topological order information for further processing.
-    """
-    driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-    with driver.session() as session:
-        # Query nodes based only on run_id
-        nodes_result = session.run("""
-            MATCH (n:Node)-[out:OUTPUT]->(r:Run {run_id: $run_id})
-            RETURN n.node_id AS node_id, n.data_in AS data_in, n.data_out AS data_out
-            """, {
-                "run_id": run_id
-            })
-
-        # Collect nodes and output data
-        nodes_data = [{"id": record["node_id"], "data_in": record["data_in"], "data_out": record["data_out"]} for record in nodes_result]
-
-        if not nodes_data:
-            raise HTTPException(status_code=404, detail="No output data found for the specified run_id.")
-
-        # Query edges between nodes for this run_id
-        edges_result = session.run("""
-            MATCH (src:Node)-[e:EDGE]->(dst:Node),
-                (src)-[:OUTPUT]->(r:Run {run_id: $run_id}),
-                (dst)-[:OUTPUT]->(r)
-            RETURN src.node_id AS src_id, dst.node_id AS dst_id, e.edge_id AS edge_id, e.src_to_dst_data_keys AS src_to_dst_data_keys
-            """, {
-                "run_id": run_id
-            })
-
-        # Collect edges data
-        edges_data = [{
-            "src": record["src_id"],
-            "dst": record["dst_id"],
-            "edge_id": record["edge_id"],
-            "src_to_dst_data_keys": record["src_to_dst_data_keys"]
-        } for record in edges_result]
-
-        # Query to get topo_order from the Run node
-        topo_order_result = session.run("""
-            MATCH (r:Run {run_id: $run_id})
-            RETURN r.topo_order AS topo_order
-            """, {
-                "run_id": run_id
-            })
-
-        # Extract topo_sort data
-        topo_sort_data = topo_order_result.single()  # Use single() to fetch the first record
-        topo_order = topo_sort_data['topo_order'] if topo_sort_data else []
-
-        return {
-            "run_id": run_id,
-            "topo_order": topo_order,  # Include topo_sort in the response
-            "nodes": nodes_data,
-            "edges": edges_data
-        }
+        This function reads the run, its per-run node outputs (the deltas saved on the OUTPUT
+        relationships, resolved through the lineage of incremental re-runs) and the edges between
+        its nodes in a single query, including topological order information for further processing.
+        Each node's `data_in` (as propagated by the run) and `data_out` are rebuilt from the graph's
+        base data and the run's deltas.
+    """
+    output = await storage.read_run_output(run_id, node_ids)
+    # A filtered request may legitimately match no nodes; an unfiltered one must have some
+    if output is None or (not output["nodes"] and node_ids is None):
+        raise HTTPException(status_code=404, detail="No output data found for the specified run_id.")
+
+    response = {
+        "run_id": run_id,
+        "status": output["status"] or "complete",  # Runs saved before statuses existed were always complete
+        "topo_order": output["topo_order"] or [],  # Include topo_sort in the response
+        "nodes": output["nodes"],
+        "edges": output["edges"]
+    }
+    if output["points"] is not None:
+        response["points"] = output["points"]
+    return response
 
 
 @app.post("/create-graph")
-def test_create_graph(graph_data: dict):
+async def test_create_graph(graph_data: dict, storage=Depends(get_storage)):
     # Time Complexity Analysis:
     # Neo4j Query (Cypher) in create_graph:
     #   - Assuming create_graph involves inserting nodes and edges in a single batch, 
@@ -232,15 +324,80 @@ def test_create_graph(graph_data: dict):
     Purpose:
         This function validates and creates a new graph by taking in a JSON object,
         initializing it with the GraphSchema, and using a helper function to insert it into the database.
+        Parsing and validating a large graph is CPU-bound, so both run in the thread pool rather than
+        stalling other requests on the event loop.
     """
-    graph = GraphSchema(**graph_data)
-    graph_id = create_graph(graph)
+    graph = await run_in_threadpool(lambda: GraphSchema(**graph_data))
+    graph_id = await storage.create_graph(graph)
     assert graph_id, "Failed to create graph"
     return graph_id
 
 
+@app.post("/create-graph/stream")
+async def create_graph_stream(request: Request):
+    # Time Complexity Analysis:
+    # Each record is validated in O(1 + k) (k = mapped keys on an edge) and written in batches,
+    # and the final acyclic / connected check is O(V + E).
+    #
+    # Space Complexity Analysis:
+    # O(batch) for pending payloads plus O(V + E) small integers / key-type maps for the structural checks,
+    # instead of several copies of the whole JSON body.
+
+    """
+    Endpoint to create a graph from a streamed NDJSON body.
+
+    Each line is one record: `{"type": "node", ...NodeSchema fields}` or `{"type": "edge", ...EdgeSchema fields}`,
+    with every node sent before the first edge. `paths_in` / `paths_out` are not needed (and are ignored);
+    the edges define the graph.
+
+    Response:
+        dict: The new `graph_id` and the number of nodes and edges stored.
+
+    Purpose:
+        Large graphs are validated record by record and flushed to MongoDB and Neo4j in batches while the
+        body is still being received, so the request never holds the whole graph in memory. If any record
+        is invalid, or the finished graph is cyclic or disconnected, everything written so far is removed.
+        Requires the Neo4j storage backend.
+    """
+    if STORAGE_BACKEND == "memory":
+        raise HTTPException(status_code=501, detail="Streamed graph creation requires the Neo4j storage backend.")
+    writer = GraphStreamWriter()
+    await writer.start()
+    buffer = b""
+    line_number = 0
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            lines = buffer.split(b"\n")
+            buffer = lines.pop()
+            for line in lines:
+                line_number += 1
+                if line.strip():
+                    writer.add(json.loads(line))
+            if writer.batch_ready:
+                await writer.flush()
+        if buffer.strip():
+            line_number += 1
+            writer.add(json.loads(buffer))
+    except ValueError as e:
+        await writer.abort()
+        raise HTTPException(status_code=400, detail=f"Line {line_number}: {e}")
+    except Exception:
+        await writer.abort()
+        raise
+
+    try:
+        return await writer.finish()
+    except ValueError as e:
+        await writer.abort()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        await writer.abort()
+        raise
+
+
 @app.get("/run_ids/{graph_id}")
-async def get_run_ids(graph_id: str):
+async def get_run_ids(graph_id: str, storage=Depends(get_storage)):
     # Time Complexity Analysis:
     # Neo4j Query (Cypher):
     #   - The query traverses from a Graph node to its related Node and Output nodes,
@@ -265,28 +422,15 @@ async def get_run_ids(graph_id: str):
         This function queries the Neo4j database to fetch all unique run IDs related to nodes
         within the specified graph, returning them as a list. If no run IDs are found, it raises a 404 error.
     """
-    driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-    with driver.session() as session:
-        query = """
-        MATCH (g:Graph {graph_id: $graph_id})<-[:PART_OF]-(n:Node)-[:OUTPUT]->(o)
-        RETURN DISTINCT o.run_id AS run_id
-        """
-        result = session.run(query, graph_id=graph_id)
-        run_ids = [record["run_id"] for record in result]
+    run_ids = await storage.run_ids(graph_id)
 
-        if not run_ids:
-            raise HTTPException(status_code=404, detail="No run IDs found for the given graph ID.")
+    if not run_ids:
+        raise HTTPException(status_code=404, detail="No run IDs found for the given graph ID.")
 
     return {"run_ids": run_ids}
 
-from collections import deque
-from fastapi import HTTPException
-from neo4j import GraphDatabase
-import json
-from uuid import uuid4
-
 @app.post("/run-graph")
-async def run_graph(config: GraphRunConfig):
+async def run_graph(config: GraphRunConfig, storage=Depends(get_storage)):
     # - Time Complexity: O(N + E)
     # - Space Complexity: O(N + E)
     """
@@ -294,206 +438,477 @@ async def run_graph(config: GraphRunConfig):
     
     Args:
         config (GraphRunConfig): Configuration object containing graph ID, lists to enable/disable nodes,
-                                 initial root inputs, and specific data overwrites.
+                                 initial root inputs, specific data overwrites, whether to run in
+                                 the background, and optionally a `base_run_id` to re-run from.
     
     Response:
         JSON object containing:
             - run_id: Unique identifier for this specific graph run.
+            - status: "complete", or "partial" when nodes on a cycle were skipped (`on_incomplete="partial"`).
+            - mode: "full", or "incremental" when only the downstream cone of the inputs changed since
+                    `base_run_id` was recomputed and saved; the other outputs are shared with the base run.
+            - memo_hit: True when an identical configuration of the same graph version already ran and
+                        its run is returned instead of creating a new one (`memoize=True`); the
+                        response then has no `timings`, as nothing was executed or saved.
+            - issues: Offending nodes (`cycle_nodes`, `unreachable_nodes`, `unknown_nodes`).
+            - timings: Statistics of the run write (`nodes`, `batches`, `save_ms`), with the bytes of
+                       deltas stored for the run (`stored_bytes`) and saved against full copies of
+                       every node's data (`saved_bytes`).
+        With `background=True` the run is queued instead and the response (202) only holds the
+        run_id and status "queued"; poll `/runs/{run_id}/status` for the outcome. A memo hit is
+        answered directly, with the remembered run's ID, rather than queued.
+
+    Raises:
+        HTTPException 400: When `base_run_id` is a run of another graph.
+        HTTPException 404: When the graph does not exist or has no nodes, or `base_run_id` does not exist.
+        HTTPException 422: When the selected subgraph has a cycle and `on_incomplete` is "fail".
+        HTTPException 503: When `background=True` and the job queue is full.
     """
-    driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-
     if config.enable_list and config.disable_list:
         raise HTTPException(status_code=400, detail="Only one of enable_list or disable_list should be provided.")
     
     run_id = str(uuid4())
-    
-    with driver.session() as session:
-        # Step 1: Fetch nodes and edges for the valid subgraph
-        nodes_data, edges_data = fetch_subgraph(session, config.graph_id, config.enable_list, config.disable_list)
 
-        # Step 2: Apply root inputs and data overwrites
-        apply_inputs_and_overwrites(nodes_data, config.root_inputs, config.data_overwrites)
+    if config.background:
+        # Reject unknown graphs before queueing, and answer memo hits now: a queued job would report
+        # the remembered run under a run_id that has no output
+        compiled = await load_compiled_graph(storage, config.graph_id)
+        if config.memoize:
+            _, memoized = await memo_lookup(config, compiled)
+            if memoized is not None:
+                return memoized
+        try:
+            get_job_queue().submit(run_id, run_graph_job, config, run_id)
+        except QueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        return JSONResponse(status_code=202, content={"run_id": run_id, "status": "queued"})
+
+    return await execute_run(storage, config, run_id)
+
+async def run_graph_job(config, run_id):
+    """
+    Background job body for `/run-graph`: execute the run on its own storage session.
 
-        # Step 3: Topological Sorting
-        topo_order = topological_sort(nodes_data, edges_data)
-
-        # Step 4: Data Propagation
-        propagate_data(nodes_data, edges_data, topo_order)
-
-        # Step 5: Save results to Neo4j
-        save_run_data(session, nodes_data, edges_data, run_id, config.graph_id, topo_order)
-
-    return {"run_id": run_id}
-
-def fetch_subgraph(session, graph_id, enable_list, disable_list):
-    # Nodes query:
-    # - Retrieves nodes based on the enable_list or disable_list.
-    # - Worst-case time complexity: O(N), where N is the total number of nodes in the graph.
-    # Edges query:
-    # - Retrieves edges where both source and destination nodes are in the valid subgraph.
-    # - Worst-case time complexity: O(E), where E is the total number of edges.
-    if enable_list:
-        nodes_query = """
-        MATCH (n {graph_id: $graph_id})
-        WHERE n.node_id IN $enable_list
-        RETURN n.node_id AS node_id, n.data_in AS data_in, n.data_out AS data_out
-        """
-        params = {"graph_id": graph_id, "enable_list": enable_list}
-    elif disable_list:
-        nodes_query = """
-        MATCH (n {graph_id: $graph_id})
-        WHERE NOT n.node_id IN $disable_list
-        RETURN n.node_id AS node_id, n.data_in AS data_in, n.data_out AS data_out
-        """
-        params = {"graph_id": graph_id, "disable_list": disable_list}
-    
-    nodes = session.run(nodes_query, params)
-    nodes_data = {
-        record["node_id"]: {
-            "data_in": json.loads(record["data_in"]) if record["data_in"] else {},
-            "data_out": json.loads(record["data_out"]) if record["data_out"] else {}
-        }
-        for record in nodes
+    The memo was already checked when the job was queued, so the run always executes under `run_id`.
+    """
+    async with open_storage() as storage:
+        return await execute_run(storage, config, run_id, lookup_memo=False)
+
+async def memo_lookup(config, compiled):
+    """
+    Run memo key of `config` and the response remembered under it, marked as a memo hit.
+
+    Returns:
+        tuple: (key, response or None on a miss), or (None, None) when `config` is not memoized.
+    """
+    if not (config.memoize and run_memo.enabled):
+        return None, None
+    with stage("memo_lookup"):
+        key = memo_key(config, await run_in_threadpool(getattr, compiled, "version"))
+        memoized = run_memo.get(key)
+    if memoized is None:
+        return key, None
+    # The remembered write statistics belong to the original request
+    response = {name: value for name, value in memoized.items() if name != "timings"}
+    return key, {**response, "memo_hit": True}
+
+async def execute_run(storage, config, run_id, lookup_memo=True):
+    """
+    Load, execute and save one run of `config` under `run_id` (see `/run-graph`).
+
+    Database I/O is awaited; planning and propagation are CPU-bound and run in the thread pool
+    so they do not stall the event loop. With `lookup_memo=False` a remembered identical run is not
+    returned, but the new run is still remembered.
+    """
+    # Step 1: Load the compiled graph (from the cache when possible) and select the valid subgraph,
+    # narrowed to the downstream cone of the changed inputs when re-running from a base run
+    compiled = await load_compiled_graph(storage, config.graph_id)
+
+    # Reuse the saved run of an identical configuration of this graph version
+    if lookup_memo:
+        key, memoized = await memo_lookup(config, compiled)
+        if memoized is not None:
+            return memoized
+    elif config.memoize and run_memo.enabled:
+        key = memo_key(config, await run_in_threadpool(getattr, compiled, "version"))
+    else:
+        key = None
+
+    with stage("topological_sort"):
+        plan = await run_in_threadpool(compiled.execution_plan, config.enable_list, config.disable_list)
+    base_lineage, cone = (None, None)
+    if config.base_run_id:
+        with stage("plan_rerun"):
+            base_lineage, cone = await plan_rerun(storage, compiled, plan, config)
+    incremental = base_lineage is not None
+    nodes_data, edges_data = compiled.subgraph(cone if incremental else plan.active)
+
+    # Step 2: Apply root inputs and data overwrites
+    apply_inputs_and_overwrites(nodes_data, config.root_inputs, config.data_overwrites)
+
+    # Step 3: Topological Sorting (precomputed by the execution plan)
+    topo_order = plan.topo_order
+    issues = plan.issues()
+    if not plan.is_complete and config.on_incomplete == "fail":
+        # Fail before any propagation or DB write for a run that would skip nodes
+        raise HTTPException(status_code=422, detail={
+            "message": "The selected subgraph contains a cycle; its nodes cannot be ordered.",
+            **issues,
+        })
+    status = "complete" if plan.is_complete else "partial"
+
+    # Step 4: Data Propagation
+    observe_run(len(nodes_data), len(edges_data))
+    with stage("propagate_data"):
+        if incremental:
+            await run_in_threadpool(plan.execute_nodes, nodes_data)
+        else:
+            await run_in_threadpool(plan.execute, nodes_data)
+
+    # Step 5: Save the results as deltas against the graph's base data
+    with stage("save_run_data"):
+        save_stats = await save_run_data(
+            storage, compiled, nodes_data, edges_data, run_id, config.graph_id, topo_order,
+            status=status, skipped_nodes=plan.cycle_nodes, config=config,
+            lineage=[run_id] + (base_lineage or []),
+        )
+
+    response = {
+        "run_id": run_id,
+        "status": status,
+        "mode": "incremental" if incremental else "full",
+        "memo_hit": False,
+        "issues": issues,
+        "timings": save_stats,
     }
+    if key is not None:
+        run_memo.put(key, config.graph_id, response)
+    return response
 
-    edges_query = """
-    MATCH (src_node {graph_id: $graph_id})-[r]->(dst_node {graph_id: $graph_id})
-    WHERE src_node.node_id IN $valid_nodes AND dst_node.node_id IN $valid_nodes
-    RETURN src_node.node_id AS src, dst_node.node_id AS dst, r.src_to_dst_data_keys AS src_to_dst_data_keys
+async def plan_rerun(storage, compiled, plan, config):
     """
-    params["valid_nodes"] = list(nodes_data.keys())
-    edges = session.run(edges_query, params)
+    Work out an incremental re-run of `config` from `config.base_run_id`.
 
-    edges_data = [
-        {
-            "src": record["src"],
-            "dst": record["dst"],
-            "src_to_dst_data_keys": json.loads(record["src_to_dst_data_keys"]) if record["src_to_dst_data_keys"] else {}
-        }
-        for record in edges
-    ]
-
-    return nodes_data, edges_data
-
-def apply_inputs_and_overwrites(nodes_data, root_inputs, data_overwrites):
-    # - Applying root inputs involves iterating over each node in root_inputs.
-    # - Time complexity: O(|R|), where |R| is the number of nodes with root inputs.
-
-    # - Applying data overwrites also involves updating specific nodes.
-    # - Time complexity: O(|D|), where |D| is the number of nodes with data overwrites.
-    for node_id, inputs in root_inputs.items():
-        if node_id in nodes_data:
-            nodes_data[node_id]["data_in"].update(inputs)
-    for node_id, overwrites in data_overwrites.items():
-        if node_id in nodes_data:
-            nodes_data[node_id]["data_in"].update(overwrites)
-
-def topological_sort(nodes_data, edges_data):
-    # 1. Building the adjacency list and in-degrees:
-    # - Iterates over E edges.
-    # - Time complexity: O(E).
-
-    # 2. Topological sorting (Kahn's algorithm):
-    # - The algorithm traverses all nodes and edges.
-    # - Time complexity: O(N + E), where N is the number of nodes and E is the number of edges.
-    in_degree = {node_id: 0 for node_id in nodes_data}
-    adjacency_list = {node_id: [] for node_id in nodes_data}
-    
-    for edge in edges_data:
-        src, dst = edge["src"], edge["dst"]
-        if src in adjacency_list and dst in in_degree:
-            adjacency_list[src].append(edge)
-            in_degree[dst] += 1
-
-    zero_in_degree = deque([node for node in in_degree if in_degree[node] == 0])
-    topo_order = []
-
-    while zero_in_degree:
-        node = zero_in_degree.popleft()
-        topo_order.append(node)
-        for edge in adjacency_list[node]:
-            dst = edge["dst"]
-            in_degree[dst] -= 1
-            if in_degree[dst] == 0:
-                zero_in_degree.append(dst)
-
-    return topo_order
-
-def propagate_data(nodes_data, edges_data, topo_order):
-    # - Iterating over each node and edge to propagate data.
-    # - Time complexity: O(E).
-    adjacency_list = {node_id: [] for node_id in nodes_data}
-    for edge in edges_data:
-        adjacency_list[edge["src"]].append(edge)
-
-    for node in topo_order:
-        for edge in adjacency_list[node]:
-            src, dst = edge["src"], edge["dst"]
-            for src_key, dst_key in edge["src_to_dst_data_keys"].items():
-                dst_data_in = nodes_data[dst]["data_in"]
-                src_data_out = nodes_data[src]["data_out"]
-                dst_data_in[dst_key] = src_data_out.get(src_key)
-
-def save_run_data(session, nodes_data, edges_data, run_id, graph_id, topo_order):
-    # 1. Run node creation:
-    # - Each run is associated with a unique run_id.
-    # - Time complexity: O(1).
+    Nodes whose `root_inputs` or `data_overwrites` entry differs from the base run's configuration
+    are the changed nodes; their downstream cone (through the cached adjacency) is all that must be
+    recomputed. Every other node keeps the base run's output.
 
-    # 2. Creating/Updating OUTPUT relationships:
-    # - Iterates over each node to create/update its output relationship.
-    # - Time complexity: O(N).
+    Returns:
+        tuple: (lineage of the base run, indexes of the cone), or (None, None) when a full run is
+               needed: the base run stored no configuration, is a sweep, selected other nodes, or its
+               lineage already reaches RERUN_MAX_LINEAGE.
+    """
+    base = await storage.fetch_run(config.base_run_id)
+    if base is None:
+        raise HTTPException(status_code=404, detail="Base run not found.")
+    if base["graph_id"] != config.graph_id:
+        raise HTTPException(status_code=400, detail="The base run belongs to another graph.")
+
+    base_config = json.loads(base["config"]) if base["config"] else None
+    new_config = json.loads(run_config_json(config))
+    if (
+        base_config is None
+        or base["sweep_points"] is not None
+        or base_config["enable_list"] != new_config["enable_list"]
+        or base_config["disable_list"] != new_config["disable_list"]
+        or len(base["lineage"]) >= RERUN_MAX_LINEAGE
+    ):
+        return None, None
+
+    changed = set()
+    for field in ("root_inputs", "data_overwrites"):
+        old, new = base_config[field], new_config[field]
+        changed.update(node_id for node_id in old.keys() | new.keys() if old.get(node_id) != new.get(node_id))
+    cone = await run_in_threadpool(compiled.downstream, changed, plan.active)
+    return base["lineage"], cone
+
+
+@app.get("/runs/{run_id}/status")
+async def get_run_status(run_id: str, storage=Depends(get_storage)):
+    """
+    Endpoint to poll the state of a run.
+
+    Args:
+        run_id (str): Unique identifier of the run.
+
+    Response:
+        JSON object containing:
+            - run_id: The run ID.
+            - status: "queued", "running", "complete", "partial" or "failed".
+            - For saved runs: `stored_bytes`, the size of the deltas stored for the run, and
+              `saved_bytes`, how much smaller they are than full copies of every node's data.
+            - For background runs known to this worker: `submitted_at`, `started_at`, `finished_at`
+              (epoch seconds) and the run `result` or `error`.
+
+    Purpose:
+        Background runs are looked up in this worker's job store; runs that are not there (synchronous
+        runs, or statuses dropped after a restart) are looked up among the saved runs.
+        Raises a 404 error if the run is unknown.
+    """
+    job = get_job_queue().status(run_id)
+    if job is not None:
+        job.pop("job_id")
+        return {"run_id": run_id, **job}
+
+    run = await storage.fetch_run(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found.")
+    return {
+        "run_id": run_id,
+        "status": run["status"] or "complete",
+        "stored_bytes": run["stored_bytes"],
+        "saved_bytes": run["saved_bytes"],
+    }
+
+@app.post("/run-graph/batch")
+async def run_graph_batch(batch: GraphRunBatchConfig, storage=Depends(get_storage)):
+    # - Time Complexity: O(G * (N + E) + P * I + R * N) for G distinct graphs, P distinct node selections
+    #   with I copy instructions each and R runs; propagation runs once per selection, not once per run.
+    # - Space Complexity: O(R * N) for the run outputs held until they are saved.
+    """
+    Endpoint to execute many graph runs in one request, e.g. a parameter sweep over one graph.
+
+    Args:
+        batch (GraphRunBatchConfig): The list of run configurations, executed in order.
 
-    session.run("""
-        MERGE (r:Run {run_id: $run_id, graph_id: $graph_id})
-        SET r.topo_order = $topo_order
-    """, {"run_id": run_id, "graph_id": graph_id, "topo_order": json.dumps(topo_order)})
-
-    for node_id, node_data in nodes_data.items():
-        session.run("""
-            MATCH (n:Node {node_id: $node_id, graph_id: $graph_id}),
-                  (r:Run {run_id: $run_id, graph_id: $graph_id})
-            MERGE (n)-[out:OUTPUT]->(r)
-            SET out.data_out = $data_out
-        """, {
-            "node_id": node_id,
-            "graph_id": graph_id,
-            "run_id": run_id,
-            "data_out": json.dumps(node_data["data_out"])
+    Response:
+        JSON object containing:
+            - run_ids: The run ID of each configuration, in request order.
+            - runs: `run_id`, `status` and `issues` of each configuration, in request order.
+            - timings: `load_ms`, `execute_ms` and `save_ms` for the whole batch, plus the number of
+                       distinct graphs and execution plans and the write statistics.
+
+    Purpose:
+        Each distinct graph is loaded and compiled once and each distinct enable/disable selection is
+        propagated once; the result is written back into every run sharing it. All runs are then saved
+        with bulk writes. The batch is validated before anything is executed or saved, so an
+        invalid configuration rejects the whole batch.
+
+    Raises:
+        HTTPException 400: When a configuration sets both enable_list and disable_list.
+        HTTPException 404: When a configuration's graph does not exist or has no nodes.
+        HTTPException 422: When the batch has more than BATCH_MAX_RUNS configurations, a configuration sets
+                           `background`, `base_run_id` or `memoize` (use `/run-graph` for those), or a
+                           configuration's subgraph has a cycle and its `on_incomplete` is "fail".
+    """
+    for index, config in enumerate(batch.runs):
+        if config.enable_list and config.disable_list:
+            raise HTTPException(status_code=400, detail=f"Run {index}: Only one of enable_list or disable_list should be provided.")
+        # Batched runs always execute in this request, in full, as new runs
+        if config.background or config.base_run_id is not None or config.memoize:
+            raise HTTPException(status_code=422, detail=f"Run {index}: background, base_run_id and memoize are not supported in a batch.")
+
+    # Step 1: Load and compile each distinct graph once, and pick every run's execution plan
+    start = time.perf_counter()
+    compiled_graphs = {}
+    plans = []
+    for index, config in enumerate(batch.runs):
+        if config.graph_id not in compiled_graphs:
+            compiled_graphs[config.graph_id] = await load_compiled_graph(storage, config.graph_id)
+        plan = await run_in_threadpool(
+            compiled_graphs[config.graph_id].execution_plan, config.enable_list, config.disable_list,
+        )
+        if not plan.is_complete and config.on_incomplete == "fail":
+            raise HTTPException(status_code=422, detail={
+                "message": f"Run {index}: The selected subgraph contains a cycle; its nodes cannot be ordered.",
+                **plan.issues(),
+            })
+        plans.append(plan)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    # Step 2: Propagate once per distinct plan, then apply each run's inputs and the propagated values.
+    # Copying and filling every run's node data is CPU-bound, so the whole step runs in the thread pool.
+    start = time.perf_counter()
+    runs, results, plan_count = await run_in_threadpool(execute_batch, batch.runs, plans, compiled_graphs)
+    execute_ms = (time.perf_counter() - start) * 1000
+
+    # Step 3: Save every run with bulk writes
+    save_stats = await storage.save_runs(runs)
+
+    return {
+        "run_ids": [result["run_id"] for result in results],
+        "runs": results,
+        "timings": {
+            "graphs": len(compiled_graphs),
+            "plans": plan_count,
+            "load_ms": load_ms,
+            "execute_ms": execute_ms,
+            **save_stats,
+        },
+    }
+
+def execute_batch(configs, plans, compiled_graphs):
+    """
+    Execute the runs of a batch (see `/run-graph/batch`): propagate each distinct plan once and write
+    the result into every run sharing it.
+
+    Returns:
+        tuple: (runs to save, per-run `run_id` / `status` / `issues`, number of distinct plans).
+    """
+    plan_values = {}
+    runs = []
+    results = []
+    for config, plan in zip(configs, plans):
+        if plan not in plan_values:
+            plan_values[plan] = plan.propagate()
+        compiled = compiled_graphs[config.graph_id]
+        nodes_data, _ = compiled.subgraph(plan.active)
+        apply_inputs_and_overwrites(nodes_data, config.root_inputs, config.data_overwrites)
+        plan.write_back(plan_values[plan], nodes_data)
+
+        run_id = str(uuid4())
+        status = "complete" if plan.is_complete else "partial"
+        runs.append({
+            "run_id": run_id, "graph_id": config.graph_id, "compiled": compiled, "nodes_data": nodes_data,
+            "topo_order": plan.topo_order, "status": status, "skipped_nodes": plan.cycle_nodes, "config": config,
         })
+        results.append({"run_id": run_id, "status": status, "issues": plan.issues()})
+    return runs, results, len(plan_values)
+
+@app.post("/run-graph/sweep")
+async def run_graph_sweep(config: GraphSweepConfig, storage=Depends(get_storage)):
+    # - Time Complexity: O(N + E + C * P) for C input columns of P points: the graph is traversed once
+    #   for the whole sweep rather than once per point.
+    # - Space Complexity: O(N + E + C * P).
+    """
+    Endpoint to run one graph over many root input vectors at once (a parameter sweep).
 
+    Args:
+        config (GraphSweepConfig): The graph ID, the node selection, and the root inputs as columns with one
+                                   value per sweep point, e.g. `{"node_A1": {"inputA1": [1, 2, 3]}}`.
 
+    Response:
+        JSON object containing:
+            - run_id: Unique identifier of the sweep, readable through `/output/{run_id}`.
+            - status: "complete", or "partial" when nodes on a cycle were skipped (`on_incomplete="partial"`).
+            - mode: "sweep".
+            - points: Number of sweep points (the length of every column).
+            - columns: The resulting `data_in` of every node given input columns, column-wise: a list of
+                       values per point for the swept keys, a single value for keys shared by every point.
+            - issues: Offending nodes (`cycle_nodes`, `unreachable_nodes`, `unknown_nodes`).
+            - timings: `execute_ms` and the statistics of the run write.
 
+    Purpose:
+        The columns are applied as NumPy arrays and the execution plan is executed once for all points:
+        propagation along the `src_to_dst_data_keys` mappings only reads `data_out`, which inputs never
+        change, so every point shares the propagated values and a sweep costs one graph traversal
+        instead of one run per point. The sweep is saved as a single run storing the column-wise
+        `data_in` keys each node changed.
+
+    Raises:
+        HTTPException 400: When both enable_list and disable_list are provided.
+        HTTPException 404: When the graph does not exist or has no nodes.
+        HTTPException 422: When the columns are not numeric, differ in length or exceed SWEEP_MAX_POINTS
+                           points, or the selected subgraph has a cycle and `on_incomplete` is "fail".
+    """
+    if config.enable_list and config.disable_list:
+        raise HTTPException(status_code=400, detail="Only one of enable_list or disable_list should be provided.")
+    try:
+        columns, points = sweep_columns(config.root_inputs)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if points > SWEEP_MAX_POINTS:
+        raise HTTPException(status_code=422, detail=f"A sweep can have at most {SWEEP_MAX_POINTS} points.")
+
+    # Step 1: Load the compiled graph and the execution plan of the selection
+    compiled = await load_compiled_graph(storage, config.graph_id)
+    plan = await run_in_threadpool(compiled.execution_plan, config.enable_list, config.disable_list)
+    issues = plan.issues()
+    if not plan.is_complete and config.on_incomplete == "fail":
+        raise HTTPException(status_code=422, detail={
+            "message": "The selected subgraph contains a cycle; its nodes cannot be ordered.",
+            **issues,
+        })
+    status = "complete" if plan.is_complete else "partial"
 
-@app.post("/get-node-output")
-async def get_node_output(request: NodeOutputRequest):
-    # Create Neo4j driver
-    driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-    
-    with driver.session() as session:
-        # Query to fetch the output data for the specified node and run
-        result = session.run("""
-            MATCH (n:Node)-[out:OUTPUT]->(r:Run {run_id: $run_id})
-            WHERE n.node_id = $node_id AND n.graph_id = $graph_id
-            RETURN out.data_out AS data_out
-            """, {
-                "node_id": request.node_id,
-                "graph_id": request.graph_id,
-                "run_id": request.run_id
-            }).single()
-        
-        # Check if the output data exists
-        if result and result["data_out"] is not None:
-            output_data = json.loads(result["data_out"])
-            return {
-                "node_id": request.node_id,
-                "run_id": request.run_id,
-                "data_out": output_data
+    # Step 2: Apply the input columns and propagate every point in a single pass
+    start = time.perf_counter()
+    nodes_data, _ = compiled.subgraph(plan.active)
+    apply_inputs_and_overwrites(nodes_data, columns, config.data_overwrites)
+    await run_in_threadpool(plan.execute, nodes_data)
+    execute_ms = (time.perf_counter() - start) * 1000
+
+    # Step 3: Save the sweep as one run
+    run_id = str(uuid4())
+    save_stats = await storage.save_runs([{
+        "run_id": run_id, "graph_id": config.graph_id, "compiled": compiled, "nodes_data": nodes_data,
+        "topo_order": plan.topo_order, "status": status, "skipped_nodes": plan.cycle_nodes,
+        "config": config, "sweep_points": points,
+    }], max_tx_rows=None)
+
+    return {
+        "run_id": run_id,
+        "status": status,
+        "mode": "sweep",
+        "points": points,
+        "columns": {
+            node_id: {
+                key: value.tolist() if isinstance(value, np.ndarray) else value
+                for key, value in nodes_data[node_id]["data_in"].items()
             }
+            for node_id in columns if node_id in nodes_data
+        },
+        "issues": issues,
+        "timings": {"execute_ms": execute_ms, **save_stats},
+    }
+
+async def load_compiled_graph(storage, graph_id):
+    """
+    Return the CompiledGraph for `graph_id`, fetching and compiling it on a cache miss.
+
+    Repeated runs of a cached graph skip the storage reads, JSON parsing and adjacency building.
+
+    Raises:
+        HTTPException 404: When the graph does not exist or has no nodes, so nothing is executed or saved.
+    """
+    compiled = graph_cache.get(graph_id)
+    if compiled is None:
+        nodes_data, edges_data = await storage.fetch_subgraph(graph_id, [], [])
+        if not nodes_data:  # Unknown graph ids are not cached
+            raise HTTPException(status_code=404, detail=f"Graph {graph_id} not found or has no nodes.")
+        with stage("compile_graph"):
+            compiled = await run_in_threadpool(CompiledGraph, graph_id, nodes_data, edges_data)
+        graph_cache.put(compiled)
+    return compiled
+
+async def save_run_data(storage, compiled, nodes_data, edges_data, run_id, graph_id, topo_order,
+                        status="complete", skipped_nodes=(), config=None, lineage=None):
+    # 1. Run creation:
+    # - Each run is associated with a unique run_id, its status, the nodes it skipped, its configuration
+    #   and its lineage (the run, then the base runs it shares outputs with).
+    # - Time complexity: O(1).
+
+    # 2. Saving the outputs:
+    # - One output per node holding only its changes against the compiled graph's base data,
+    #   written in batches inside a single transaction by the Neo4j backend.
+    # - Time complexity: O(N).
+    run = {
+        "run_id": run_id, "graph_id": graph_id, "compiled": compiled, "nodes_data": nodes_data,
+        "topo_order": topo_order, "status": status, "skipped_nodes": skipped_nodes,
+        "config": config, "lineage": lineage,
+    }
+    return await storage.save_runs([run], max_tx_rows=None)
+
+
+@app.post("/get-node-output")
+async def get_node_output(request: NodeOutputRequest, storage=Depends(get_storage)):
+    # Output data saved for the specified node and run; for an incremental re-run the output may
+    # have been written by one of its base runs, so the nearest run of its lineage is taken
+    data_out = await storage.node_output(request.graph_id, request.run_id, request.node_id)
+
+    # Check if the output data exists
+    if data_out is not None:
+        output_data = json.loads(data_out)
+        return {
+            "node_id": request.node_id,
+            "run_id": request.run_id,
+            "data_out": output_data
+        }
         
-        raise HTTPException(status_code=404, detail="Output data not found for the specified node and run_id")
+    raise HTTPException(status_code=404, detail="Output data not found for the specified node and run_id")
     
 @app.post("/get-leaf-outputs")
-async def get_leaf_outputs(request: LeafOutputRequest):
+async def get_leaf_outputs(request: LeafOutputRequest, storage=Depends(get_storage)):
     """
     Endpoint to retrieve the output data for leaf nodes (nodes with no outgoing edges) in a specified graph run.
     
@@ -506,59 +921,85 @@ async def get_leaf_outputs(request: LeafOutputRequest):
             - leaf_outputs: Dictionary with leaf node IDs as keys and their respective output data as values.
     
     Purpose:
-        This function identifies all leaf nodes in the specified graph that have no outgoing edges. It then
-        extracts the output data corresponding to the provided run ID and returns it. If no output data is found
-        for the given run ID or graph ID, it raises a 404 error.
-    """
-    driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-
-    with driver.session() as session:
-        # Step 1: Query all nodes and their output data for the specified run_id
-        nodes_result = session.run("""
-            MATCH (n:Node)-[out:OUTPUT]->(r:Run {run_id: $run_id})
-            RETURN n.node_id AS node_id, n.data_in AS data_in, n.data_out AS data_out
-        """, {
-            "run_id": request.run_id
-        })
+        This function identifies the leaf nodes of the specified run (nodes with no outgoing edge to another
+        node of the run) and returns their output data. Leaves are found by the storage rather than by
+        transferring every node and edge: with Neo4j, a run over the whole graph uses the `is_leaf` flags
+        stored at graph creation (an index lookup), and a run over an enable/disable selection uses a
+        single query checking for outgoing edges inside the run. Outputs are the `data_out` saved by the run (or by
+        the base run an incremental re-run carried them over from). If the run does not exist or belongs
+        to another graph, or no leaf outputs are found, it raises a 404 error.
+    """
+    # Step 1: Resolve the run (an incremental re-run has the node set of the full run at the end of its lineage)
+    run = await storage.fetch_run(request.run_id)
+    if run is None or run["graph_id"] != request.graph_id:
+        raise HTTPException(status_code=404, detail="No output data found for the specified run_id.")
 
-        # Collect nodes and output data
-        nodes_data = [{"id": record["node_id"], "data_in": record["data_in"], "data_out": record["data_out"]} for record in nodes_result]
+    # Step 2: Leaves of a run over the whole graph are the graph's leaves
+    config = json.loads(run["config"]) if run["config"] else None
+    whole_graph = (
+        config is not None and not config["enable_list"] and not config["disable_list"]
+        and not json.loads(run["skipped_nodes"] or "[]")
+    )
 
-        if not nodes_data:
-            raise HTTPException(status_code=404, detail="No output data found for the specified run_id.")
+    # Step 3: Outputs saved for the leaves by the nearest run of the lineage
+    records = await storage.leaf_outputs(request.graph_id, run["lineage"], whole_graph)
 
-        # Step 2: Query all edges between nodes for this run_id
-        edges_result = session.run("""
-            MATCH (src:Node)-[e:EDGE]->(dst:Node),
-                (src)-[:OUTPUT]->(r:Run {run_id: $run_id}),
-                (dst)-[:OUTPUT]->(r)
-            RETURN src.node_id AS src_id, dst.node_id AS dst_id
-        """, {
-            "run_id": request.run_id
-        })
+    # Parse the JSON output data of each leaf ({} when the node has no data_out)
+    leaf_outputs = {node_id: json.loads(data_out) if data_out else {} for node_id, data_out in records}
+
+    # Step 4: Check if any leaf outputs were found
+    if leaf_outputs:
+        return {"run_id": request.run_id, "leaf_outputs": leaf_outputs}
+    else:
+        raise HTTPException(status_code=404, detail="No leaf outputs found for the specified run_id.")
 
-        # Collect edges data
-        edges_data = [{"src": record["src_id"], "dst": record["dst_id"]} for record in edges_result]
-
-        # Step 3: Identify leaf nodes from nodes_data based on edges_data
-        # Create a set of all nodes that are sources (have outgoing edges)
-        outgoing_nodes = {edge["src"] for edge in edges_data}
-
-        # Find leaf nodes (nodes that are in nodes_data but not in outgoing_nodes)
-        leaf_outputs = {}
-        for node in nodes_data:
-            if node["id"] not in outgoing_nodes:  # This means it's a leaf node
-                # Parse the JSON output data correctly
-                if node["data_out"]:
-                    leaf_outputs[node["id"]] = json.loads(node["data_out"])  # Parse the output JSON string into a dictionary
-                else:
-                    leaf_outputs[node["id"]] = {}  # Handle case where data_out is None
-
-        # Step 4: Check if any leaf outputs were found
-        if leaf_outputs:
-            return {"run_id": request.run_id, "leaf_outputs": leaf_outputs}
-        else:
-            raise HTTPException(status_code=404, detail="No leaf outputs found for the specified run_id.")
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Endpoint exposing this worker's metrics in the Prometheus text format.
 
+    Response:
+        Histograms of request durations and Cypher round trips per request (by method and route),
+        durations of each run stage (`fetch_subgraph`, `parse_json`, `compile_graph`, `memo_lookup`,
+        `topological_sort`, `plan_rerun`, `propagate_data`, `save_run_data`) and the node and edge
+        counts of each run. Histograms have no samples when METRICS_ENABLED is false.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health")
+async def health():
+    """
+    Endpoint reporting the state of the shared database connection pools.
 
+    Response:
+        JSON object containing:
+            - storage: The configured storage backend (STORAGE_BACKEND).
+            - neo4j: Pool usage of the shared Neo4j driver (`in_use`, `idle`, `waiters`) and its configured limits.
+            - mongo: Checkout counts and wait times of the shared MongoDB client pool.
+            - graph_cache: Size and hit/miss/eviction counters of the compiled graph cache.
+            - jobs: Queued and running background runs and the queue limits.
+            - run_memo: Entry count and hit/miss/eviction/expiration counters of the run memo.
+    """
+    return {
+        "storage": STORAGE_BACKEND,
+        "neo4j": get_pool_metrics(),
+        "mongo": get_mongo_pool_metrics(),
+        "graph_cache": graph_cache.stats(),
+        "jobs": get_job_queue().stats(),
+        "run_memo": run_memo.stats(),
+    }
+
+
+@app.delete("/api/cache/{graph_id}")
+async def invalidate_graph_cache(graph_id: str):
+    """
+    Endpoint to drop a graph from this worker's compiled graph cache and run memo.
+
+    Args:
+        graph_id (str): Unique identifier of the graph to invalidate, or `*` to clear the whole cache.
+    """
+    graph_cache.invalidate(None if graph_id == "*" else graph_id)
+    run_memo.invalidate(None if graph_id == "*" else graph_id)
+    return {"invalidated": graph_id}
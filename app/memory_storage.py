@@ -0,0 +1,227 @@
+from bisect import bisect_right
+from starlette.concurrency import run_in_threadpool
+from schemas import GraphSchema
+from storage import GraphStorage, encode_run, apply_delta
+from graph_cache import graph_cache
+import json
+import time
+
+
+class MemoryGraph:
+    """A stored graph: parsed node payloads, edges and the indexes the read paths need."""
+
+    def __init__(self, graph):
+        self.nodes = {
+            node.node_id: {"data_in": dict(node.data_in), "data_out": dict(node.data_out)} for node in graph.nodes
+        }
+        self.edges = [
+            {"src": edge.src_node, "dst": edge.dst_node, "edge_id": edge.edge_id,
+             "src_to_dst_data_keys": dict(edge.src_to_dst_data_keys)}
+            for edge in graph.edges
+        ]
+        self.out_edges = {node_id: [] for node_id in self.nodes}  # node_id -> outgoing edges, in edge order
+        for edge in self.edges:
+            self.out_edges[edge["src"]].append(edge)
+        self.sorted_ids = sorted(self.nodes)  # Node IDs in page order
+
+
+class MemoryStorage(GraphStorage):
+    """
+    Storage kept in this process's memory, for running and load-testing the API without databases.
+
+    Graphs and runs are plain dictionaries with the same contents as the Neo4j backend stores, so both
+    backends return identical responses. Nothing is persisted across restarts or shared between workers.
+    Every method but `create_graph` and `save_runs` completes without awaiting, so concurrent requests on
+    the event loop never interleave inside one; those two validate, index or encode off the loop and then
+    store the finished graph or runs without awaiting again.
+    """
+
+    def __init__(self):
+        self.graphs = {}  # graph_id -> MemoryGraph
+        self.runs = {}  # run_id -> run row (see `encode_run`) plus its `outputs`: node_id -> output row
+        self.graph_runs = {}  # graph_id -> run_ids, in save order
+
+    def clear(self):
+        """Drop every graph and run."""
+        self.graphs.clear()
+        self.runs.clear()
+        self.graph_runs.clear()
+
+    # ---- Graphs ---- #
+    async def create_graph(self, graph):
+        if not await run_in_threadpool(GraphSchema.validate_graph_structure, graph):
+            raise ValueError("Initial validation failed: The graph structure is invalid.")
+        graph_id = str(graph.id)
+        self.graphs[graph_id] = await run_in_threadpool(MemoryGraph, graph)
+        graph_cache.invalidate(graph_id)
+        return graph_id
+
+    async def list_graphs(self):
+        return list(self.graphs)
+
+    async def graph_nodes(self, graph_id, full, ids=None):
+        graph = self.graphs.get(graph_id)
+        if graph is None:
+            return
+        for node_id in graph.nodes if ids is None else dict.fromkeys(ids):
+            node = graph.nodes.get(node_id)
+            if node is not None:
+                yield self._node(node_id, node, full)
+
+    async def graph_edges(self, graph_id, full):
+        graph = self.graphs.get(graph_id)
+        if graph is None:
+            return
+        for edge in graph.edges:
+            yield self._edge(edge, full)
+
+    async def graph_page(self, graph_id, full, after, limit):
+        graph = self.graphs.get(graph_id)
+        if graph is None:
+            return [], []
+        start = 0 if after is None else bisect_right(graph.sorted_ids, after)
+        page = graph.sorted_ids[start:start + limit]
+        nodes_data = [self._node(node_id, graph.nodes[node_id], full) for node_id in page]
+        edges_data = [self._edge(edge, full) for node_id in page for edge in graph.out_edges[node_id]]
+        return nodes_data, edges_data
+
+    async def fetch_subgraph(self, graph_id, enable_list, disable_list):
+        graph = self.graphs.get(graph_id)
+        if graph is None:
+            return {}, []
+        if enable_list:
+            wanted = set(enable_list)
+            node_ids = [node_id for node_id in graph.nodes if node_id in wanted]
+        elif disable_list:
+            unwanted = set(disable_list)
+            node_ids = [node_id for node_id in graph.nodes if node_id not in unwanted]
+        else:
+            node_ids = list(graph.nodes)
+        nodes_data = {
+            node_id: {"data_in": dict(graph.nodes[node_id]["data_in"]),
+                      "data_out": dict(graph.nodes[node_id]["data_out"])}
+            for node_id in node_ids
+        }
+        edges_data = [
+            {"src": edge["src"], "dst": edge["dst"], "src_to_dst_data_keys": dict(edge["src_to_dst_data_keys"])}
+            for edge in graph.edges
+            if edge["src"] in nodes_data and edge["dst"] in nodes_data
+        ]
+        return nodes_data, edges_data
+
+    # ---- Runs ---- #
+    async def save_runs(self, runs, **options):
+        start = time.perf_counter()
+        encoded = await run_in_threadpool(lambda: [encode_run(run) for run in runs])
+        nodes = stored_bytes = saved_bytes = 0
+        for row, rows in encoded:
+            stored = self.runs.get(row["run_id"])
+            outputs = stored["outputs"] if stored is not None else {}
+            outputs.update((output["node_id"], output) for output in rows)
+            self.runs[row["run_id"]] = dict(row, outputs=outputs)
+            if stored is None:
+                self.graph_runs.setdefault(row["graph_id"], []).append(row["run_id"])
+            nodes += len(rows)
+            stored_bytes += row["stored_bytes"]
+            saved_bytes += row["saved_bytes"]
+        return {
+            "runs": len(runs),
+            "nodes": nodes,
+            "batches": 0,
+            "transactions": 1 if runs else 0,
+            "save_ms": (time.perf_counter() - start) * 1000,
+            "stored_bytes": stored_bytes,
+            "saved_bytes": saved_bytes,
+        }
+
+    async def fetch_run(self, run_id):
+        run = self.runs.get(run_id)
+        if run is None:
+            return None
+        return {key: value for key, value in run.items() if key not in ("run_id", "outputs")}
+
+    async def run_ids(self, graph_id):
+        return list(self.graph_runs.get(graph_id, []))
+
+    async def read_run_output(self, run_id, node_ids=None):
+        run = self.runs.get(run_id)
+        if run is None:
+            return None
+        graph = self.graphs.get(run["graph_id"])
+        full_run = self.runs.get(run["lineage"][-1])
+        if graph is None or full_run is None:
+            return {"status": run["status"], "topo_order": run["topo_order"], "points": run["sweep_points"],
+                    "nodes": [], "edges": []}
+
+        selected = full_run["outputs"].keys() if node_ids is None else [
+            node_id for node_id in dict.fromkeys(node_ids) if node_id in full_run["outputs"]
+        ]
+        nodes_data = []
+        for node_id in selected:
+            output = self._output(run["lineage"], node_id)
+            nodes_data.append({
+                "id": node_id,
+                "data_in": apply_delta(json.dumps(graph.nodes[node_id]["data_in"]), output["delta_in"]),
+                "data_out": apply_delta(json.dumps(graph.nodes[node_id]["data_out"]), output["delta_out"]),
+            })
+        members = {node["id"] for node in nodes_data}
+        edges_data = [
+            {"src": edge["src"], "dst": edge["dst"], "edge_id": edge["edge_id"],
+             "src_to_dst_data_keys": json.dumps(edge["src_to_dst_data_keys"])}
+            for node in nodes_data for edge in graph.out_edges[node["id"]]
+            if edge["dst"] in members
+        ]
+        return {"status": run["status"], "topo_order": run["topo_order"], "points": run["sweep_points"],
+                "nodes": nodes_data, "edges": edges_data}
+
+    async def node_output(self, graph_id, run_id, node_id):
+        run = self.runs.get(run_id)
+        graph = self.graphs.get(graph_id)
+        if run is None or graph is None or run["graph_id"] != graph_id:
+            return None
+        output = self._output(run["lineage"], node_id)
+        return self._data_out(graph, node_id, output) if output is not None else None
+
+    async def leaf_outputs(self, graph_id, lineage, whole_graph):
+        graph = self.graphs.get(graph_id)
+        full_run = self.runs.get(lineage[-1])
+        if graph is None or full_run is None:
+            return []
+        members = full_run["outputs"]
+        return [
+            (node_id, self._data_out(graph, node_id, self._output(lineage, node_id)))
+            for node_id in members
+            if not any(edge["dst"] in members for edge in graph.out_edges[node_id])
+        ]
+
+    def _output(self, lineage, node_id):
+        """Output row of `node_id` written by the nearest run of `lineage`, or None."""
+        for run_id in lineage:
+            run = self.runs.get(run_id)
+            if run is not None and node_id in run["outputs"]:
+                return run["outputs"][node_id]
+        return None
+
+    @staticmethod
+    def _data_out(graph, node_id, output):
+        """`data_out` JSON of a node reconstructed from its output row."""
+        return apply_delta(json.dumps(graph.nodes[node_id]["data_out"]), output["delta_out"])
+
+    @staticmethod
+    def _node(node_id, node, full):
+        entry = {"id": node_id}
+        if full:
+            entry["data_in"] = node["data_in"]
+            entry["data_out"] = node["data_out"]
+        return entry
+
+    @staticmethod
+    def _edge(edge, full):
+        entry = {"src": edge["src"], "dst": edge["dst"]}
+        if full:
+            entry["src_to_dst_data_keys"] = edge["src_to_dst_data_keys"]
+        return entry
+
+
+# Process-wide store used when STORAGE_BACKEND is "memory"
+memory_storage = MemoryStorage()
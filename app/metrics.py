@@ -0,0 +1,218 @@
+from contextlib import nullcontext
+from contextvars import ContextVar
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Collect request, stage and Cypher metrics (exposed on /metrics); when false every hook is a no-op
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Also return the stage timings of each request in a Server-Timing response header
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "false").lower() == "true"
+
+# Histogram bucket upper bounds
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+class Histogram:
+    """
+    Prometheus histogram with a fixed set of label names.
+
+    Each distinct combination of label values keeps its own cumulative bucket counts, sum and count.
+    """
+
+    def __init__(self, name, help, labels=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """Record one observation of `value` for the given label values (in `labels` order)."""
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        """Return the histogram in the Prometheus text exposition format."""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {label_values: list(values) for label_values, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values)]
+            for bound, count in zip(self.buckets + ("+Inf",), values[:-2] + [values[-1]]):
+                bucket_labels = ",".join(labels + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {count}")
+            suffix = "{" + ",".join(labels) + "}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {values[-2]}")
+            lines.append(f"{self.name}_count{suffix} {values[-1]}")
+        return "\n".join(lines)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram(
+    "graphflow_request_duration_seconds", "Time spent handling HTTP requests.", labels=("method", "route"),
+)
+REQUEST_CYPHER_QUERIES = Histogram(
+    "graphflow_request_cypher_queries", "Cypher round trips issued per HTTP request.",
+    labels=("method", "route"), buckets=COUNT_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "graphflow_stage_duration_seconds", "Time spent in each stage of a graph run.", labels=("stage",),
+)
+RUN_NODES = Histogram("graphflow_run_nodes", "Nodes executed per graph run.", buckets=SIZE_BUCKETS)
+RUN_EDGES = Histogram("graphflow_run_edges", "Edges of the subgraph executed per graph run.", buckets=SIZE_BUCKETS)
+
+HISTOGRAMS = (REQUEST_SECONDS, REQUEST_CYPHER_QUERIES, STAGE_SECONDS, RUN_NODES, RUN_EDGES)
+
+
+class RequestMetrics:
+    """Stage timings and Cypher round trips of the request being handled."""
+
+    def __init__(self):
+        self.stages = {}  # stage -> seconds, summed over repeated stages
+        self.cypher_queries = 0
+
+    def server_timing(self, total):
+        """Format the stages, the Cypher round trips and `total` seconds as a Server-Timing header value."""
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        entries.append(f'cypher;desc="{self.cypher_queries} queries"')
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+# Metrics of the current request, set by MetricsMiddleware (None outside of a request, e.g. in background jobs)
+_request_metrics = ContextVar("request_metrics", default=None)
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(seconds, self.name)
+        request = _request_metrics.get()
+        if request is not None:
+            request.stages[self.name] = request.stages.get(self.name, 0) + seconds
+
+
+_DISABLED_STAGE = nullcontext()
+
+
+def stage(name):
+    """Context manager timing one stage of a run into the stage histogram and the request's Server-Timing."""
+    return _Stage(name) if METRICS_ENABLED else _DISABLED_STAGE
+
+
+def observe_run(nodes, edges):
+    """Record the number of nodes and edges a graph run executed."""
+    if METRICS_ENABLED:
+        RUN_NODES.observe(nodes)
+        RUN_EDGES.observe(edges)
+
+
+def _count_query():
+    request = _request_metrics.get()
+    if request is not None:
+        request.cypher_queries += 1
+
+
+class _CountingTransaction:
+    """Transaction proxy counting each `run` as a Cypher round trip of the current request."""
+
+    def __init__(self, tx):
+        self._tx = tx
+
+    async def run(self, *args, **kwargs):
+        _count_query()
+        return await self._tx.run(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._tx, name)
+
+
+class CountingSession:
+    """Neo4j session proxy counting the queries of `run`, `execute_read` and `execute_write` per request."""
+
+    def __init__(self, session):
+        self._session = session
+
+    async def run(self, *args, **kwargs):
+        _count_query()
+        return await self._session.run(*args, **kwargs)
+
+    async def execute_read(self, work, *args, **kwargs):
+        return await self._session.execute_read(lambda tx, *a, **k: work(_CountingTransaction(tx), *a, **k),
+                                                *args, **kwargs)
+
+    async def execute_write(self, work, *args, **kwargs):
+        return await self._session.execute_write(lambda tx, *a, **k: work(_CountingTransaction(tx), *a, **k),
+                                                 *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+def count_queries(session):
+    """Wrap a Neo4j session so its queries are counted, or return it unchanged when metrics are disabled."""
+    return CountingSession(session) if METRICS_ENABLED else session
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request by method and route template.
+
+    It makes a RequestMetrics available to `stage` and `count_queries` for the duration of the
+    request and, with METRICS_SERVER_TIMING, adds its stage timings as a Server-Timing header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = RequestMetrics()
+        token = _request_metrics.set(request)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", request.server_timing(time.perf_counter() - start).encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing if METRICS_SERVER_TIMING else send)
+        finally:
+            _request_metrics.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], route)
+            REQUEST_CYPHER_QUERIES.observe(request.cypher_queries, scope["method"], route)
+
+
+def render_metrics():
+    """Return every histogram in the Prometheus text exposition format."""
+    return "\n".join(histogram.render() for histogram in HISTOGRAMS) + "\n"
@@ -1,83 +1,167 @@
-from neo4j import GraphDatabase
+from neo4j_database import get_driver
 from schemas import GraphSchema
 import json
-from dotenv import load_dotenv
+import logging
 import os
+import time
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-neo4j_uri = os.getenv("neo4j_uri")
-neo4j_user = os.getenv("neo4j_user")
-neo4j_password = os.getenv("neo4j_password")
+# Number of nodes / edges sent per UNWIND transaction during ingestion
+NEO4J_INGEST_BATCH_SIZE = int(os.getenv("NEO4J_INGEST_BATCH_SIZE", "5000"))
 
-def create_graph_in_neo4j(graph_data: GraphSchema):
+CREATE_GRAPH_QUERY = """
+CREATE (g:Graph {graph_id: $graph_id})
+"""
+
+# Creates a batch of nodes and links each one to the main graph node
+CREATE_NODES_QUERY = """
+MATCH (g:Graph {graph_id: $graph_id})
+UNWIND $rows AS row
+CREATE (n:Node {node_id: row.node_id, data_in: row.data_in, data_out: row.data_out, graph_id: $graph_id,
+                is_leaf: row.is_leaf})-[:PART_OF]->(g)
+"""
+
+# Creates a batch of directed EDGE relationships with their data key mappings
+CREATE_EDGES_QUERY = """
+UNWIND $rows AS row
+MATCH (src:Node {graph_id: $graph_id, node_id: row.src_node}),
+      (dst:Node {graph_id: $graph_id, node_id: row.dst_node})
+CREATE (src)-[e:EDGE {edge_id: row.edge_id, src_to_dst_data_keys: row.src_to_dst_data_keys}]->(dst)
+"""
+
+# Removes the graph's nodes in bounded transactions, then the graph node itself
+DELETE_NODES_QUERY = """
+MATCH (n:Node {graph_id: $graph_id})
+CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS
+"""
+
+DELETE_GRAPH_QUERY = """
+MATCH (g:Graph {graph_id: $graph_id})
+DETACH DELETE g
+"""
+
+# Flags the nodes without outgoing edges, in bounded transactions, once all edges exist
+SET_LEAF_FLAGS_QUERY = """
+MATCH (n:Node {graph_id: $graph_id})
+CALL { WITH n SET n.is_leaf = NOT EXISTS { (n)-[:EDGE]->() } } IN TRANSACTIONS OF 10000 ROWS
+"""
+
+
+def _chunks(rows, size):
+    """Yield consecutive slices of `rows` holding at most `size` items."""
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+async def _run_write(tx, query, **params):
+    """Transaction function running a single write query."""
+    await (await tx.run(query, **params)).consume()
+
+
+def node_row(node, is_leaf=None):
+    """
+    UNWIND row for a NodeSchema, with its data dictionaries serialized to JSON.
+
+    `is_leaf` (no outgoing edges) is left unset when the edges are not known yet; see `set_leaf_flags`.
+    """
+    return {
+        "node_id": node.node_id,
+        "data_in": json.dumps(node.data_in),
+        "data_out": json.dumps(node.data_out),
+        "is_leaf": is_leaf,
+    }
+
+
+def edge_row(edge):
+    """UNWIND row for an EdgeSchema, with its data key mapping serialized to JSON."""
+    return {
+        "src_node": edge.src_node,
+        "dst_node": edge.dst_node,
+        "edge_id": edge.edge_id,
+        "src_to_dst_data_keys": json.dumps(edge.src_to_dst_data_keys) if edge.src_to_dst_data_keys else "{}",
+    }
+
+
+async def create_graph_node(session, graph_id):
+    """Create the main Graph node that every Node is linked to."""
+    await session.execute_write(_run_write, CREATE_GRAPH_QUERY, graph_id=graph_id)
+
+
+async def create_nodes_batch(session, graph_id, rows):
+    """Create a batch of nodes (see `node_row`) and their PART_OF links in one transaction."""
+    await session.execute_write(_run_write, CREATE_NODES_QUERY, graph_id=graph_id, rows=rows)
+
+
+async def create_edges_batch(session, graph_id, rows):
+    """Create a batch of edges (see `edge_row`) in one transaction."""
+    await session.execute_write(_run_write, CREATE_EDGES_QUERY, graph_id=graph_id, rows=rows)
+
+
+async def delete_graph_in_neo4j(graph_id: str):
+    """Remove a graph, its nodes and everything attached to them (used for rollback)."""
+    async with get_driver().session() as session:
+        # CALL ... IN TRANSACTIONS only runs in an auto-commit transaction
+        await (await session.run(DELETE_NODES_QUERY, graph_id=graph_id)).consume()
+        await (await session.run(DELETE_GRAPH_QUERY, graph_id=graph_id)).consume()
+
+
+async def set_leaf_flags(graph_id: str):
+    """Set `is_leaf` on every node of a graph from its stored edges."""
+    async with get_driver().session() as session:
+        # CALL ... IN TRANSACTIONS only runs in an auto-commit transaction
+        await (await session.run(SET_LEAF_FLAGS_QUERY, graph_id=graph_id)).consume()
+
+
+async def create_graph_in_neo4j(graph_data: GraphSchema, batch_size: int = NEO4J_INGEST_BATCH_SIZE):
     """
     Creates a graph in the Neo4j database with nodes and edges based on validated MongoDB data.
 
     Args:
         graph_data (GraphSchema): The graph data to be created, including nodes and edges.
+        batch_size (int): Number of nodes or edges sent per UNWIND transaction.
+
+    Returns:
+        dict: Ingestion statistics (`nodes`, `edges`, `batches`, `seconds`, `nodes_per_sec`).
 
     Purpose:
         This function adds a new graph to the Neo4j database, creating nodes, their associated data,
         and relationships (edges) between nodes, ensuring each node is linked to the main graph node.
+        Nodes without outgoing edges are stored with `is_leaf = true` for indexed leaf lookups.
+        Nodes and edges are sent as UNWIND parameter lists, one explicit transaction per batch,
+        so ingestion costs O((V + E) / batch_size) round trips instead of O(2V + E).
     """
-    driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
+    driver = get_driver()  # Shared pooled driver, owned by the application lifespan
     graph_id = str(graph_data.id)  # Convert graph ID to string for database compatibility
 
-    with driver.session() as session:
+    # Serialize the data dictionaries to JSON strings once, up front, and flag the leaves
+    sources = {edge.src_node for edge in graph_data.edges}
+    node_rows = [node_row(node, is_leaf=node.node_id not in sources) for node in graph_data.nodes]
+    edge_rows = [edge_row(edge) for edge in graph_data.edges]
+
+    start = time.perf_counter()
+    batches = 0
+    async with driver.session() as session:
         # Step 1: Create the main graph node
-        session.run(
-            """
-            CREATE (g:Graph {graph_id: $graph_id})
-            """,
-            graph_id=graph_id
-        )
-
-        # Step 2: Create each node in the graph with data_in and data_out properties
-        # Link each node to the main graph node using PART_OF relationship
-        for node in graph_data.nodes:
-            data_in_json = json.dumps(node.data_in)  # Serialize data_in dictionary to JSON
-            data_out_json = json.dumps(node.data_out)  # Serialize data_out dictionary to JSON
-
-            # Create the individual node with data properties
-            session.run(
-                """
-                CREATE (n:Node {node_id: $node_id, data_in: $data_in, data_out: $data_out, graph_id: $graph_id})
-                """,
-                node_id=node.node_id,
-                graph_id=graph_id,
-                data_in=data_in_json,
-                data_out=data_out_json,
-            )
-
-            # Establish PART_OF relationship between node and graph
-            session.run(
-                """
-                MATCH (g:Graph {graph_id: $graph_id}), (n:Node {node_id: $node_id, graph_id: $graph_id})
-                CREATE (n)-[:PART_OF]->(g)
-                """,
-                graph_id=graph_id,
-                node_id=node.node_id
-            )
-
-        # Step 3: Create edges between nodes with src_to_dst_data_keys properties
-        for edge in graph_data.edges:
-            src_to_dst_data_keys_json = json.dumps(edge.src_to_dst_data_keys) if edge.src_to_dst_data_keys else "{}"
-
-            # Create directed EDGE relationship between source and destination nodes with data key mapping
-            session.run(
-                """
-                MATCH (src:Node {node_id: $src_node, graph_id: $graph_id}),
-                      (dst:Node {node_id: $dst_node, graph_id: $graph_id})
-                CREATE (src)-[e:EDGE {edge_id: $edge_id, src_to_dst_data_keys: $src_to_dst_data_keys}]->(dst)
-                """,
-                src_node=edge.src_node,
-                dst_node=edge.dst_node,
-                edge_id=edge.edge_id,
-                graph_id=graph_id,
-                src_to_dst_data_keys=src_to_dst_data_keys_json,
-            )
-
-    # Close the database driver after all operations are complete
-    driver.close()
+        await create_graph_node(session, graph_id)
+
+        # Step 2: Create the nodes and their PART_OF relationships, one transaction per batch
+        for rows in _chunks(node_rows, batch_size):
+            await create_nodes_batch(session, graph_id, rows)
+            batches += 1
+
+        # Step 3: Create the edges between nodes, one transaction per batch
+        for rows in _chunks(edge_rows, batch_size):
+            await create_edges_batch(session, graph_id, rows)
+            batches += 1
 
+    seconds = time.perf_counter() - start
+    stats = {
+        "nodes": len(node_rows),
+        "edges": len(edge_rows),
+        "batches": batches,
+        "seconds": seconds,
+        "nodes_per_sec": len(node_rows) / seconds if seconds else 0.0,
+    }
+    logger.info("Created graph %s in Neo4j: %s", graph_id, stats)
+    return stats
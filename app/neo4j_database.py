@@ -0,0 +1,154 @@
+from contextlib import nullcontext
+from neo4j import AsyncGraphDatabase
+import logging
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Constants
+NEO4J_URI = os.getenv("neo4j_uri")
+NEO4J_USER = os.getenv("neo4j_user")
+NEO4J_PASSWORD = os.getenv("neo4j_password")
+
+# Connection pool tuning
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "100"))
+NEO4J_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "60"))  # seconds
+NEO4J_MAX_CONNECTION_LIFETIME = float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600"))  # seconds
+
+# Process-wide driver, created once by the application lifespan
+_driver = None
+
+
+def init_driver():
+    """
+    Create the process-wide async Neo4j driver (and its connection pool) if it does not exist yet.
+
+    Connections are opened lazily by the first query, so this needs no running event loop, but the
+    driver must then be used and closed on a single loop.
+    """
+    global _driver
+    if _driver is None:
+        _driver = AsyncGraphDatabase.driver(
+            NEO4J_URI,
+            auth=(NEO4J_USER, NEO4J_PASSWORD),
+            max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+            connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT,
+            max_connection_lifetime=NEO4J_MAX_CONNECTION_LIFETIME,
+        )
+    return _driver
+
+
+async def close_driver():
+    """Close the process-wide Neo4j driver and release every pooled connection."""
+    global _driver
+    if _driver is not None:
+        await _driver.close()
+        _driver = None
+
+
+def get_driver():
+    """Return the shared Neo4j driver, creating it lazily for scripts running outside the app lifespan."""
+    return init_driver()
+
+
+def get_pool_metrics():
+    """
+    Report connection pool usage of the shared driver.
+
+    The driver exposes no public pool statistics, so the counts are read from the pool internals of
+    the pinned driver version (neo4j==5.25.0 in requirements.txt). Each internal attribute is looked
+    up defensively: a count whose attributes are missing in another driver version is reported as
+    None (unavailable) instead of failing or silently reading 0.
+
+    Returns:
+        dict: `in_use`, `idle` and `waiters` counts plus the configured limits.
+              Counts are 0 when the driver has not been created yet, None when unavailable.
+    """
+    metrics = {
+        "in_use": 0,
+        "idle": 0,
+        "waiters": 0,
+        "max_pool_size": NEO4J_MAX_POOL_SIZE,
+        "acquisition_timeout": NEO4J_ACQUISITION_TIMEOUT,
+        "max_connection_lifetime": NEO4J_MAX_CONNECTION_LIFETIME,
+    }
+    if _driver is None:
+        return metrics
+    pool = getattr(_driver, "_pool", None)
+    if pool is None:
+        return dict(metrics, in_use=None, idle=None, waiters=None)
+
+    lock = getattr(pool, "lock", None)
+    with lock if lock is not None else nullcontext():
+        connections = getattr(pool, "connections", None)
+        in_use = [
+            getattr(connection, "in_use", None)
+            for pooled in (connections.values() if isinstance(connections, dict) else ())
+            for connection in pooled
+        ]
+        if connections is None or None in in_use:
+            metrics["in_use"] = metrics["idle"] = None
+        else:
+            metrics["in_use"] = sum(1 for used in in_use if used)
+            metrics["idle"] = len(in_use) - metrics["in_use"]
+        waiters = getattr(getattr(pool, "cond", None), "_waiters", None)
+        metrics["waiters"] = len(waiters) if waiters is not None else None
+    return metrics
+
+
+# Idempotent schema migration run at startup. The uniqueness constraints are backed by
+# indexes, so Graph.graph_id, (Node.graph_id, Node.node_id) and Run.run_id lookups become seeks.
+SCHEMA_STATEMENTS = [
+    "CREATE CONSTRAINT graph_graph_id IF NOT EXISTS FOR (g:Graph) REQUIRE g.graph_id IS UNIQUE",
+    "CREATE CONSTRAINT node_graph_id_node_id IF NOT EXISTS FOR (n:Node) REQUIRE (n.graph_id, n.node_id) IS UNIQUE",
+    "CREATE CONSTRAINT run_run_id IF NOT EXISTS FOR (r:Run) REQUIRE r.run_id IS UNIQUE",
+    "CREATE INDEX node_graph_id IF NOT EXISTS FOR (n:Node) ON (n.graph_id)",
+    "CREATE INDEX run_graph_id IF NOT EXISTS FOR (r:Run) ON (r.graph_id)",
+    "CREATE INDEX node_graph_id_is_leaf IF NOT EXISTS FOR (n:Node) ON (n.graph_id, n.is_leaf)",
+]
+
+# Representative lookups of the hot queries, each expected to plan as an index seek
+INDEX_USAGE_CHECKS = {
+    "graph_by_graph_id": "MATCH (g:Graph {graph_id: $graph_id}) RETURN g",
+    "nodes_by_graph_id": "MATCH (n:Node {graph_id: $graph_id}) RETURN n",
+    "node_by_graph_id_node_id": "MATCH (n:Node {graph_id: $graph_id, node_id: $node_id}) RETURN n",
+    "leaves_by_graph_id": "MATCH (n:Node {graph_id: $graph_id, is_leaf: true}) RETURN n",
+    "run_by_run_id": "MATCH (r:Run {run_id: $run_id}) RETURN r",
+    "runs_by_graph_id": "MATCH (r:Run {graph_id: $graph_id}) RETURN r",
+}
+
+
+async def create_constraints():
+    """Create the Neo4j constraints and indexes if missing and wait for them to come online."""
+    async with get_driver().session() as session:
+        for statement in SCHEMA_STATEMENTS:
+            await (await session.run(statement)).consume()
+        await (await session.run("CALL db.awaitIndexes()")).consume()
+
+
+def _plan_operators(plan):
+    """Yield the operator type of every step in an EXPLAIN plan tree."""
+    yield plan["operatorType"]
+    for child in plan.get("children", []):
+        yield from _plan_operators(child)
+
+
+async def check_index_usage():
+    """
+    EXPLAIN each entry of INDEX_USAGE_CHECKS and report whether its plan uses an index seek.
+
+    Returns:
+        dict: Check name -> True if the plan contains an index seek operator.
+    """
+    params = {"graph_id": "", "node_id": "", "run_id": ""}
+    results = {}
+    async with get_driver().session() as session:
+        for name, query in INDEX_USAGE_CHECKS.items():
+            plan = (await (await session.run("EXPLAIN " + query, params)).consume()).plan
+            results[name] = any("IndexSeek" in operator for operator in _plan_operators(plan))
+            if not results[name]:
+                logger.warning("Query %s does not use an index seek: %s", name, query)
+    return results
@@ -0,0 +1,342 @@
+from crud import create_graph
+from metrics import stage
+from starlette.concurrency import run_in_threadpool
+from storage import GraphStorage, encode_run, apply_delta
+import json
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Number of node outputs sent per UNWIND statement when saving a run
+NEO4J_RUN_BATCH_SIZE = int(os.getenv("NEO4J_RUN_BATCH_SIZE", "10000"))
+# Node outputs committed per write transaction by /run-graph/batch (a run is never split across two)
+NEO4J_RUN_TX_MAX_ROWS = int(os.getenv("NEO4J_RUN_TX_MAX_ROWS", "100000"))
+
+
+# Per-run outputs of a run: for each node of its full run (the end of its lineage), the OUTPUT written
+# by the nearest run of the lineage, then the edges between those nodes, as a single result row.
+# $node_ids (or null for every node) restricts both nodes and edges to a subset. Nodes come with the
+# graph's base data and the run's deltas (see `encode_run`); outputs saved before runs were
+# delta-encoded hold full copies in `out.data_in` / `out.data_out`, which take the place of the base.
+RUN_OUTPUT_QUERY = """
+MATCH (run:Run {run_id: $run_id})
+WITH run, coalesce(run.lineage, [run.run_id]) AS lineage
+CALL {
+    WITH lineage
+    UNWIND range(0, size(lineage) - 1) AS depth
+    MATCH (n:Node)-[out:OUTPUT]->(:Run {run_id: lineage[depth]})
+    WHERE $node_ids IS NULL OR n.node_id IN $node_ids
+    WITH n, out ORDER BY depth
+    WITH n, head(collect(out)) AS out
+    RETURN collect({id: n.node_id, data_in: coalesce(out.data_in, n.data_in), data_out: coalesce(out.data_out, n.data_out),
+                    delta_in: out.delta_in, delta_out: out.delta_out}) AS nodes
+}
+CALL {
+    WITH lineage
+    MATCH (src:Node)-[e:EDGE]->(dst:Node),
+          (src)-[:OUTPUT]->(full:Run {run_id: last(lineage)}),
+          (dst)-[:OUTPUT]->(full)
+    WHERE $node_ids IS NULL OR (src.node_id IN $node_ids AND dst.node_id IN $node_ids)
+    RETURN collect({src: src.node_id, dst: dst.node_id, edge_id: e.edge_id,
+                    src_to_dst_data_keys: e.src_to_dst_data_keys}) AS edges
+}
+RETURN run.status AS status, run.topo_order AS topo_order, run.sweep_points AS points, nodes, edges
+"""
+
+# Output saved by the run for each matched leaf `n`: the OUTPUT of the nearest run of $lineage
+LEAF_OUTPUT_RETURN = """
+    CALL {
+        WITH n
+        UNWIND range(0, size($lineage) - 1) AS depth
+        MATCH (n)-[out:OUTPUT]->(:Run {run_id: $lineage[depth]})
+        RETURN coalesce(out.data_out, n.data_out) AS data_out, out.delta_out AS delta_out
+        ORDER BY depth
+        LIMIT 1
+    }
+    RETURN n.node_id AS node_id, data_out, delta_out
+"""
+
+
+def graph_nodes_query(full):
+    """Query for the nodes of a graph, with or without their payloads."""
+    return f"""
+    MATCH (n:Node {{graph_id: $graph_id}})
+    RETURN n.node_id AS node_id{", n.data_in AS data_in, n.data_out AS data_out" if full else ""}
+    """
+
+def graph_edges_query(full):
+    """Query for the edges of a graph, with or without their key mappings."""
+    return f"""
+    MATCH (src:Node {{graph_id: $graph_id}})-[r:EDGE]->(dst:Node)
+    RETURN src.node_id AS src, dst.node_id AS dst{", r.src_to_dst_data_keys AS src_to_dst_data_keys" if full else ""}
+    """
+
+def graph_node(record, full):
+    """Response entry of a node record; `id` only unless `full`."""
+    node = {"id": record["node_id"]}  # Use "id" for compatibility with ForceGraph3D
+    if full:
+        node["data_in"] = json.loads(record["data_in"]) if record["data_in"] else {}
+        node["data_out"] = json.loads(record["data_out"]) if record["data_out"] else {}
+    return node
+
+def graph_edge(record, full):
+    """Response entry of an edge record; `src` / `dst` only unless `full`."""
+    edge = {"src": record["src"], "dst": record["dst"]}
+    if full:
+        keys = record["src_to_dst_data_keys"]
+        edge["src_to_dst_data_keys"] = json.loads(keys) if keys else {}
+    return edge
+
+
+class Neo4jStorage(GraphStorage):
+    """
+    Storage on the shared databases: graphs in MongoDB and Neo4j (see `crud.create_graph`), runs as Run
+    nodes with one OUTPUT relationship per node in Neo4j, holding the node's deltas. Queries go through one Neo4j session.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    # ---- Graphs ---- #
+    async def create_graph(self, graph):
+        return await create_graph(graph)
+
+    async def list_graphs(self):
+        result = await self.session.run("MATCH (g:Graph) RETURN g.graph_id AS graph_id")
+        return [record["graph_id"] async for record in result]
+
+    async def graph_nodes(self, graph_id, full, ids=None):
+        if ids is None:
+            result = await self.session.run(graph_nodes_query(full), {"graph_id": graph_id})
+        else:
+            result = await self.session.run("""
+                MATCH (n:Node {graph_id: $graph_id})
+                WHERE n.node_id IN $ids
+                RETURN n.node_id AS node_id, n.data_in AS data_in, n.data_out AS data_out
+            """, {"graph_id": graph_id, "ids": ids})
+        async for record in result:
+            yield graph_node(record, full)
+
+    async def graph_edges(self, graph_id, full):
+        result = await self.session.run(graph_edges_query(full), {"graph_id": graph_id})
+        async for record in result:
+            yield graph_edge(record, full)
+
+    async def graph_page(self, graph_id, full, after, limit):
+        result = await self.session.run(f"""
+            MATCH (n:Node {{graph_id: $graph_id}})
+            {"WHERE n.node_id > $after" if after is not None else ""}
+            WITH n ORDER BY n.node_id LIMIT $limit
+            OPTIONAL MATCH (n)-[r:EDGE]->(dst:Node)
+            RETURN n.node_id AS node_id{", n.data_in AS data_in, n.data_out AS data_out" if full else ""},
+                   collect(CASE WHEN dst IS NULL THEN NULL ELSE {{
+                       dst: dst.node_id{", src_to_dst_data_keys: r.src_to_dst_data_keys" if full else ""}
+                   }} END) AS out_edges
+            ORDER BY node_id
+        """, {"graph_id": graph_id, "after": after, "limit": limit})
+
+        nodes_data, edges_data = [], []
+        async for record in result:
+            nodes_data.append(graph_node(record, full))
+            for edge in record["out_edges"]:
+                edges_data.append(graph_edge(dict(edge, src=record["node_id"]), full))
+        return nodes_data, edges_data
+
+    async def fetch_subgraph(self, graph_id, enable_list, disable_list):
+        # Nodes query:
+        # - Retrieves nodes based on the enable_list or disable_list (the whole graph when both are empty).
+        # - Worst-case time complexity: O(N), where N is the total number of nodes in the graph.
+        # Edges query:
+        # - Retrieves edges where both source and destination nodes are in the valid subgraph.
+        # - Worst-case time complexity: O(E), where E is the total number of edges.
+        if enable_list:
+            nodes_query = """
+            MATCH (n:Node {graph_id: $graph_id})
+            WHERE n.node_id IN $enable_list
+            RETURN n.node_id AS node_id, n.data_in AS data_in, n.data_out AS data_out
+            """
+            params = {"graph_id": graph_id, "enable_list": enable_list}
+        elif disable_list:
+            nodes_query = """
+            MATCH (n:Node {graph_id: $graph_id})
+            WHERE NOT n.node_id IN $disable_list
+            RETURN n.node_id AS node_id, n.data_in AS data_in, n.data_out AS data_out
+            """
+            params = {"graph_id": graph_id, "disable_list": disable_list}
+        else:
+            nodes_query = """
+            MATCH (n:Node {graph_id: $graph_id})
+            RETURN n.node_id AS node_id, n.data_in AS data_in, n.data_out AS data_out
+            """
+            params = {"graph_id": graph_id}
+
+        if enable_list or disable_list:
+            edges_query = """
+            MATCH (src_node:Node {graph_id: $graph_id})-[r:EDGE]->(dst_node:Node)
+            WHERE src_node.node_id IN $valid_nodes AND dst_node.node_id IN $valid_nodes
+            RETURN src_node.node_id AS src, dst_node.node_id AS dst, r.src_to_dst_data_keys AS src_to_dst_data_keys
+            """
+        else:
+            edges_query = """
+            MATCH (src_node:Node {graph_id: $graph_id})-[r:EDGE]->(dst_node:Node)
+            RETURN src_node.node_id AS src, dst_node.node_id AS dst, r.src_to_dst_data_keys AS src_to_dst_data_keys
+            """
+        # Both round trips are timed together, then the JSON payloads are parsed
+        with stage("fetch_subgraph"):
+            nodes = await self.session.run(nodes_query, params)
+            node_records = [record async for record in nodes]
+            if enable_list or disable_list:
+                params["valid_nodes"] = [record["node_id"] for record in node_records]
+            edges = await self.session.run(edges_query, params)
+            edge_records = [record async for record in edges]
+
+        with stage("parse_json"):
+            nodes_data = {
+                record["node_id"]: {
+                    "data_in": json.loads(record["data_in"]) if record["data_in"] else {},
+                    "data_out": json.loads(record["data_out"]) if record["data_out"] else {}
+                }
+                for record in node_records
+            }
+            edges_data = [
+                {
+                    "src": record["src"],
+                    "dst": record["dst"],
+                    "src_to_dst_data_keys": json.loads(record["src_to_dst_data_keys"]) if record["src_to_dst_data_keys"] else {}
+                }
+                for record in edge_records
+            ]
+
+        return nodes_data, edges_data
+
+    # ---- Runs ---- #
+    async def save_runs(self, runs, batch_size=NEO4J_RUN_BATCH_SIZE, max_tx_rows=NEO4J_RUN_TX_MAX_ROWS):
+        # - Creates all Run nodes of a transaction with one UNWIND, then the OUTPUT relationships of
+        #   every run in UNWIND batches of `batch_size` rows.
+        # - Runs are grouped into write transactions of at most `max_tx_rows` outputs (None: one transaction).
+        # - Time complexity: O(R + N) for R runs with N outputs in total, with O(N / batch_size) round trips
+        #   and O(N / max_tx_rows) commits.
+        # Delta encoding diffs and serializes every node: do it off the event loop, before any transaction opens
+        encoded = await run_in_threadpool(lambda: [encode_run(run) for run in runs])
+
+        transactions = []  # (run rows, output rows)
+        run_rows, tx_output_rows = [], []
+        stored_bytes = saved_bytes = 0
+        for row, rows in encoded:
+            if run_rows and max_tx_rows is not None and len(tx_output_rows) + len(rows) > max_tx_rows:
+                transactions.append((run_rows, tx_output_rows))
+                run_rows, tx_output_rows = [], []
+            run_rows.append(row)
+            tx_output_rows.extend(rows)
+            stored_bytes += row["stored_bytes"]
+            saved_bytes += row["saved_bytes"]
+        if run_rows:
+            transactions.append((run_rows, tx_output_rows))
+
+        async def write_runs(tx, run_rows, output_rows):
+            await (await tx.run("""
+                UNWIND $runs AS run
+                MERGE (r:Run {run_id: run.run_id, graph_id: run.graph_id})
+                SET r.topo_order = run.topo_order, r.status = run.status, r.skipped_nodes = run.skipped_nodes,
+                    r.config = run.config, r.lineage = run.lineage, r.sweep_points = run.sweep_points,
+                    r.stored_bytes = run.stored_bytes, r.saved_bytes = run.saved_bytes
+            """, {"runs": run_rows})).consume()
+
+            for start in range(0, len(output_rows), batch_size):
+                await (await tx.run("""
+                    UNWIND $rows AS row
+                    MATCH (r:Run {run_id: row.run_id})
+                    MATCH (n:Node {graph_id: r.graph_id, node_id: row.node_id})
+                    CREATE (n)-[out:OUTPUT]->(r)
+                    SET out.delta_in = row.delta_in, out.delta_out = row.delta_out
+                """, {"rows": output_rows[start:start + batch_size]})).consume()
+
+        start = time.perf_counter()
+        batches = 0
+        for run_rows, tx_output_rows in transactions:
+            await self.session.execute_write(write_runs, run_rows, tx_output_rows)
+            batches += -(-len(tx_output_rows) // batch_size)
+        return {
+            "runs": len(runs),
+            "nodes": sum(len(rows) for _, rows in transactions),
+            "batches": batches,
+            "transactions": len(transactions),
+            "save_ms": (time.perf_counter() - start) * 1000,
+            "stored_bytes": stored_bytes,
+            "saved_bytes": saved_bytes,
+        }
+
+    async def fetch_run(self, run_id):
+        result = await self.session.run("""
+            MATCH (r:Run {run_id: $run_id})
+            RETURN r.graph_id AS graph_id, r.status AS status, r.topo_order AS topo_order, r.config AS config,
+                   r.skipped_nodes AS skipped_nodes, coalesce(r.lineage, [r.run_id]) AS lineage,
+                   r.sweep_points AS sweep_points, r.stored_bytes AS stored_bytes, r.saved_bytes AS saved_bytes
+        """, run_id=run_id)
+        return await result.single()
+
+    async def run_ids(self, graph_id):
+        result = await self.session.run("""
+            MATCH (r:Run {graph_id: $graph_id})
+            RETURN r.run_id AS run_id
+        """, graph_id=graph_id)
+        return [record["run_id"] async for record in result]
+
+    async def read_run_output(self, run_id, node_ids=None):
+        # One query in one read transaction: O(L * V + E) for V nodes, E edges and a lineage of L runs
+        async def read(tx):
+            result = await tx.run(RUN_OUTPUT_QUERY, run_id=run_id, node_ids=node_ids)
+            record = await result.single()
+            return record.data() if record is not None else None
+
+        output = await self.session.execute_read(read)
+        if output is not None:
+            output["nodes"] = [
+                {"id": node["id"], "data_in": apply_delta(node["data_in"], node["delta_in"]),
+                 "data_out": apply_delta(node["data_out"], node["delta_out"])}
+                for node in output["nodes"]
+            ]
+        return output
+
+    async def node_output(self, graph_id, run_id, node_id):
+        # For an incremental re-run the output may have been written by one of its base runs,
+        # so take the nearest run of its lineage
+        result = await self.session.run("""
+            MATCH (r:Run {run_id: $run_id})
+            WITH coalesce(r.lineage, [r.run_id]) AS lineage
+            MATCH (n:Node {graph_id: $graph_id, node_id: $node_id})-[out:OUTPUT]->(owner:Run)
+            WHERE owner.run_id IN lineage
+            RETURN coalesce(out.data_out, n.data_out) AS data_out, out.delta_out AS delta_out
+            ORDER BY [depth IN range(0, size(lineage) - 1) WHERE lineage[depth] = owner.run_id][0]
+            LIMIT 1
+            """, {
+                "node_id": node_id,
+                "graph_id": graph_id,
+                "run_id": run_id
+            })
+        record = await result.single()
+        return apply_delta(record["data_out"], record["delta_out"]) if record else None
+
+    async def leaf_outputs(self, graph_id, lineage, whole_graph):
+        params = {"graph_id": graph_id, "run_id": lineage[-1], "lineage": lineage}
+
+        # Leaves of a run over the whole graph are the graph's leaves, flagged at creation (an index lookup)
+        records = []
+        if whole_graph:
+            result = await self.session.run("""
+                MATCH (n:Node {graph_id: $graph_id, is_leaf: true})-[:OUTPUT]->(r:Run {run_id: $run_id})
+            """ + LEAF_OUTPUT_RETURN, params)
+            records = [record async for record in result]
+
+        # Otherwise (or for graphs created before the flags existed) find them inside the run.
+        # A non-empty DAG always has a leaf, so an empty flagged result means the flags are missing.
+        if not records:
+            result = await self.session.run("""
+                MATCH (n:Node {graph_id: $graph_id})-[:OUTPUT]->(r:Run {run_id: $run_id})
+                WHERE NOT EXISTS { MATCH (n)-[:EDGE]->(:Node)-[:OUTPUT]->(r) }
+            """ + LEAF_OUTPUT_RETURN, params)
+            records = [record async for record in result]
+
+        return [(record["node_id"], apply_delta(record["data_out"], record["delta_out"])) for record in records]
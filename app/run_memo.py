@@ -0,0 +1,107 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Number of run configurations remembered per process (0 disables memoization)
+RUN_MEMO_MAX_SIZE = int(os.getenv("RUN_MEMO_MAX_SIZE", "10000"))
+# Seconds a remembered run is reused before the configuration is executed again
+RUN_MEMO_TTL = float(os.getenv("RUN_MEMO_TTL", "3600"))
+
+
+def memo_key(config, graph_version):
+    """
+    Content address of a run: SHA-256 of the canonicalized GraphRunConfig fields that determine
+    its results, plus the version of the graph it runs on.
+
+    Dictionary keys are sorted and enable/disable lists are treated as sets, so equivalent
+    configurations hash the same; execution options that do not change results are left out.
+    """
+    canonical = json.dumps({
+        "graph_id": config.graph_id,
+        "graph_version": graph_version,
+        "root_inputs": config.root_inputs,
+        "data_overwrites": config.data_overwrites,
+        "enable_list": sorted(set(config.enable_list)),
+        "disable_list": sorted(set(config.disable_list)),
+        "on_incomplete": config.on_incomplete,
+    }, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class RunMemo:
+    """
+    Per-process map from run content address (see `memo_key`) to the response of the saved run.
+
+    Entries expire `ttl` seconds after they are stored and the least recently used entries are
+    dropped beyond `max_size`.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (graph_id, stored_at, response)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self):
+        """False when RUN_MEMO_MAX_SIZE is 0."""
+        return self.max_size > 0
+
+    def get(self, key):
+        """Return the remembered response for `key`, or None on a miss or expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, graph_id, response):
+        """Remember `response` under `key`, evicting least recently used entries beyond `max_size`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (graph_id, time.monotonic(), response)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, graph_id=None):
+        """Forget the runs of `graph_id`, or every run when no graph_id is given."""
+        with self._lock:
+            if graph_id is None:
+                self._entries.clear()
+                return
+            for key in [key for key, entry in self._entries.items() if entry[0] == graph_id]:
+                del self._entries[key]
+
+    def stats(self):
+        """Return entry count and hit/miss/eviction/expiration counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# Process-wide memo shared by every request
+run_memo = RunMemo(RUN_MEMO_MAX_SIZE, RUN_MEMO_TTL)
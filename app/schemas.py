@@ -1,7 +1,13 @@
 from pydantic import BaseModel, Field, root_validator, ConfigDict
-from typing import List, Dict, Optional, Union, Any
+from typing import List, Dict, Optional, Union, Any, Literal
 from bson import ObjectId
-import networkx as nx
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+# Largest number of run configurations accepted by /run-graph/batch
+BATCH_MAX_RUNS = int(os.getenv("BATCH_MAX_RUNS", "1000"))
 
 # ---- Utility to handle ObjectId ---- #
 
@@ -59,6 +65,74 @@ class NodeSchema(BaseModel):
 
 # ---- Graph Schema ---- #
 
+def _index_paths(nodes, attribute):
+    """
+    Index the `paths_in` or `paths_out` records of every node.
+
+    Maps (node index, edge_id, src_node, dst_node) to the list of data key mappings recorded
+    under it, so an edge is present in a node's paths exactly when its mapping is in that list.
+    """
+    index = {}
+    for position, node in enumerate(nodes):
+        for path in getattr(node, attribute):
+            index.setdefault((position, path.edge_id, path.src_node, path.dst_node), []).append(path.src_to_dst_data_keys)
+    return index
+
+
+def check_acyclic_and_connected(num_nodes, edge_src, edge_dst):
+    """
+    Raise ValueError unless the graph is a DAG forming a single weakly connected component.
+
+    Args:
+        num_nodes (int): Number of nodes, identified by the indexes 0 .. num_nodes - 1.
+        edge_src, edge_dst (List[int]): Source and destination node index of every edge.
+
+    Runs in O(V + E): Kahn's algorithm over CSR arrays for acyclicity, union-find for connectivity.
+    """
+    # Check for cycles (Kahn's algorithm orders every node only if the graph is acyclic)
+    in_degree = [0] * num_nodes
+    offsets = [0] * (num_nodes + 1)
+    for src, dst in zip(edge_src, edge_dst):
+        offsets[src + 1] += 1
+        in_degree[dst] += 1
+    for index in range(num_nodes):
+        offsets[index + 1] += offsets[index]
+    successors = [0] * len(edge_dst)
+    cursor = offsets[:-1]
+    for src, dst in zip(edge_src, edge_dst):
+        successors[cursor[src]] = dst
+        cursor[src] += 1
+
+    ready = [index for index, degree in enumerate(in_degree) if degree == 0]
+    ordered = 0
+    while ready:
+        index = ready.pop()
+        ordered += 1
+        for successor in successors[offsets[index]:offsets[index + 1]]:
+            in_degree[successor] -= 1
+            if in_degree[successor] == 0:
+                ready.append(successor)
+    if ordered != num_nodes:
+        raise ValueError("The graph must be a Directed Acyclic Graph (DAG).")
+
+    # Check for islands (ensuring all nodes are in a single connected component)
+    parent = list(range(num_nodes))  # Union-find forest over undirected edges
+    for src, dst in zip(edge_src, edge_dst):
+        root_src, root_dst = _find(parent, src), _find(parent, dst)
+        if root_src != root_dst:
+            parent[root_src] = root_dst
+    if len({_find(parent, index) for index in range(num_nodes)}) > 1:
+        raise ValueError("All nodes must be connected; isolated subgraphs found.")
+
+
+def _find(parent, index):
+    """Union-find root lookup with path halving."""
+    while parent[index] != index:
+        parent[index] = parent[parent[index]]
+        index = parent[index]
+    return index
+
+
 class GraphSchema(BaseModel):
     """Schema for representing a graph containing nodes and edges."""
     
@@ -81,27 +155,31 @@ class GraphSchema(BaseModel):
             nodes = graph_data.get("nodes", [])
             edges = graph_data.get("edges", [])
         
+        # Every check below is a single pass over hashed indexes, so validation is O(V + E)
         # Check for unique node IDs within the graph
-        node_ids = [node.node_id for node in nodes]
-        if len(node_ids) != len(set(node_ids)):
-            raise ValueError("Each node_id within a graph must be unique.")
-        
-        # Initialize the directed graph
-        G = nx.DiGraph()
-        G.add_nodes_from(node_ids)
+        node_index = {}
+        for node in nodes:
+            if node.node_id in node_index:
+                raise ValueError("Each node_id within a graph must be unique.")
+            node_index[node.node_id] = len(node_index)
+        node_by_index = list(nodes)
+
+        # Hashed index of every node's path records, for O(1) edge parity checks
+        paths_out = _index_paths(nodes, "paths_out")
+        paths_in = _index_paths(nodes, "paths_in")
+
+        edge_src, edge_dst = [], []  # Edge endpoints as node indexes
 
-        # Mapping node data for type checks
-        node_data_out_map = {node.node_id: node.data_out for node in nodes}
-        node_data_in_map = {node.node_id: node.data_in for node in nodes}
-        
         edge_pairs = set()  # Track edge pairs to detect duplicates
         for edge in edges:
             # Check if edge references existing nodes
-            if edge.src_node not in node_ids or edge.dst_node not in node_ids:
+            src = node_index.get(edge.src_node)
+            dst = node_index.get(edge.dst_node)
+            if src is None or dst is None:
                 raise ValueError("Edges must reference existing nodes in the graph.")
-            
-            # Add edge to directed graph
-            G.add_edge(edge.src_node, edge.dst_node)
+
+            edge_src.append(src)
+            edge_dst.append(dst)
 
             # Ensure there are no duplicate edges from the same source node to the same destination node
             edge_pair = (edge.src_node, edge.dst_node)
@@ -110,26 +188,24 @@ class GraphSchema(BaseModel):
             edge_pairs.add(edge_pair)
 
             # Validate compatible data types for src_to_dst_data_keys
+            src_data_out = node_by_index[src].data_out
+            dst_data_in = node_by_index[dst].data_in
             for src_key, dst_key in edge.src_to_dst_data_keys.items():
-                src_data_type = type(node_data_out_map[edge.src_node].get(src_key, None))
-                dst_data_type = type(node_data_in_map[edge.dst_node].get(dst_key, None))
+                src_data_type = type(src_data_out.get(src_key, None))
+                dst_data_type = type(dst_data_in.get(dst_key, None))
                 if src_data_type != dst_data_type:
                     raise ValueError(f"Incompatible data types for key '{src_key}' in {edge.src_node} "
                                      f"to key '{dst_key}' in {edge.dst_node}: {src_data_type} vs {dst_data_type}.")
-            
+
             # Ensure bidirectional parity in nodes' path records
-            src_node = next(node for node in nodes if node.node_id == edge.src_node)
-            dst_node = next(node for node in nodes if node.node_id == edge.dst_node)
-            if edge not in src_node.paths_out or edge not in dst_node.paths_in:
+            mapping = edge.src_to_dst_data_keys
+            out_key = (src, edge.edge_id, edge.src_node, edge.dst_node)
+            in_key = (dst, edge.edge_id, edge.src_node, edge.dst_node)
+            if mapping not in paths_out.get(out_key, ()) or mapping not in paths_in.get(in_key, ()):
                 raise ValueError(f"Edge parity error: {edge.src_node} -> {edge.dst_node} must be present in both nodes.")
 
-        # Check for cycles
-        if not nx.is_directed_acyclic_graph(G):
-            raise ValueError("The graph must be a Directed Acyclic Graph (DAG).")
-
-        # Check for islands (ensuring all nodes are in a single connected component)
-        if len(list(nx.weakly_connected_components(G))) > 1:
-            raise ValueError("All nodes must be connected; isolated subgraphs found.")
+        # Check for cycles and islands
+        check_acyclic_and_connected(len(nodes), edge_src, edge_dst)
 
         return True  # Validation successful
 
@@ -175,6 +251,30 @@ class GraphRunConfig(BaseModel):
     data_overwrites: Dict[str, Dict[str, Union[int, str, float, Any]]]  # Data overwrites for specific nodes
     enable_list: List[str] = []  # List of nodes to enable for this run
     disable_list: List[str] = []  # List of nodes to disable for this run
+    execution_mode: Literal["sequential"] = "sequential"  # Runs always propagate sequentially; "parallel" is rejected
+    on_incomplete: Literal["fail", "partial"] = "fail"  # Reject runs whose subgraph has a cycle, or save them as partial
+    background: bool = False  # Queue the run and return its run_id immediately (poll /runs/{run_id}/status)
+    base_run_id: Optional[str] = None  # Re-run incrementally: recompute only what changed since this run of the graph
+    memoize: bool = False  # Return the existing run of an identical configuration and graph version, if remembered
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)  # Allow arbitrary types in validation
+
+
+class GraphRunBatchConfig(BaseModel):
+    """Configuration for executing several graph runs in one request."""
+
+    runs: List[GraphRunConfig] = Field(max_length=BATCH_MAX_RUNS)  # Run configurations, executed and returned in order
+
+
+class GraphSweepConfig(BaseModel):
+    """Configuration for a parameter sweep: one run of a graph over many root input vectors."""
+
+    graph_id: str  # Identifier for the graph to run
+    root_inputs: Dict[str, Dict[str, List[Union[int, float]]]]  # Input columns: one value per sweep point
+    data_overwrites: Dict[str, Dict[str, Union[int, str, float, Any]]] = {}  # Data overwrites shared by every point
+    enable_list: List[str] = []  # List of nodes to enable for this sweep
+    disable_list: List[str] = []  # List of nodes to disable for this sweep
+    on_incomplete: Literal["fail", "partial"] = "fail"  # Reject sweeps whose subgraph has a cycle, or save them as partial
 
     model_config = ConfigDict(arbitrary_types_allowed=True)  # Allow arbitrary types in validation
 
@@ -0,0 +1,173 @@
+from abc import ABC, abstractmethod
+import json
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Persistence used by the API: "neo4j" (graphs in MongoDB + Neo4j, runs in Neo4j) or "memory" (this process only)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "neo4j")
+
+
+class GraphStorage(ABC):
+    """
+    Interface of the persistence layer behind the API.
+
+    Graph payloads are returned parsed, in the entry shapes of the graph read endpoints: nodes as
+    `{"id", "data_in", "data_out"}` and edges as `{"src", "dst", "src_to_dst_data_keys"}` (payloads only
+    when `full`). Run outputs are stored as deltas against the graph's base data (see `encode_run`) and
+    returned reconstructed, as JSON strings, by `read_run_output`, `node_output` and `leaf_outputs`.
+    """
+
+    # ---- Graphs ---- #
+    @abstractmethod
+    async def create_graph(self, graph):
+        """Validate and store a GraphSchema; return its graph_id."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_graphs(self):
+        """Return the ids of every stored graph."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def graph_nodes(self, graph_id, full, ids=None):
+        """Async iterator over the node entries of a graph, restricted to `ids` when given."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def graph_edges(self, graph_id, full):
+        """Async iterator over the edge entries of a graph."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def graph_page(self, graph_id, full, after, limit):
+        """Up to `limit` node entries in node ID order after `after`, and their outgoing edges: (nodes, edges)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def fetch_subgraph(self, graph_id, enable_list, disable_list):
+        """Return the `nodes_data` / `edges_data` of the nodes selected by the lists (the whole graph when both are empty)."""
+        raise NotImplementedError
+
+    # ---- Runs ---- #
+    @abstractmethod
+    async def save_runs(self, runs, **options):
+        """
+        Persist runs (see `encode_run` for their fields) and return write statistics
+        (`runs`, `nodes`, `batches`, `transactions`, `save_ms`, `stored_bytes`, `saved_bytes`).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def fetch_run(self, run_id):
+        """
+        Return the stored attributes of a run (`graph_id`, `status`, `topo_order`, `config`, `skipped_nodes`,
+        `lineage`, `sweep_points`, `stored_bytes`, `saved_bytes`), or None.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def run_ids(self, graph_id):
+        """Return the ids of the runs of a graph."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def read_run_output(self, run_id, node_ids=None):
+        """
+        Return `status`, `topo_order`, `points`, `nodes` (`id`, `data_in`, `data_out`) and `edges`
+        (`src`, `dst`, `edge_id`, `src_to_dst_data_keys`) of a run, or None if it does not exist.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def node_output(self, graph_id, run_id, node_id):
+        """Return the `data_out` saved for a node by a run (or its nearest base run), or None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def leaf_outputs(self, graph_id, lineage, whole_graph):
+        """
+        Return (node_id, data_out) of the leaves of the run whose `lineage` is given: nodes of its full
+        run without an outgoing edge to another node of it. `whole_graph` is True when the run selected
+        every node of the graph, so its leaves are the graph's leaves.
+        """
+        raise NotImplementedError
+
+
+def run_config_json(config):
+    """Serialize the parts of a GraphRunConfig that determine a run's results."""
+    return json.dumps({
+        "root_inputs": config.root_inputs,
+        "data_overwrites": config.data_overwrites,
+        "enable_list": config.enable_list,
+        "disable_list": config.disable_list,
+    })
+
+
+def encode_run(run):
+    """
+    Stored form of a run: (run row, output rows).
+
+    `run` holds `run_id`, `graph_id`, `nodes_data`, `topo_order`, `status`, `skipped_nodes` and the
+    CompiledGraph `compiled` it was executed from, and optionally the GraphRunConfig `config`, the
+    `lineage` (default: the run alone) and, for a sweep, `sweep_points`.
+
+    Each node of `nodes_data` that was not skipped gets one output row holding only what the run changed
+    against the graph's base data (see `node_delta`): `delta_in` and `delta_out` are JSON objects of the
+    changed keys, or None. The run row records `stored_bytes`, the size of those deltas, and
+    `saved_bytes`, how much smaller they are than a full copy of every node's `data_in` and `data_out`.
+    """
+    compiled = run["compiled"]
+    skipped = set(run["skipped_nodes"])
+    rows = []
+    full_bytes = stored_bytes = 0
+    for node_id, node_data in run["nodes_data"].items():
+        if node_id in skipped:
+            continue
+        index = compiled.node_index[node_id]
+        delta_in = node_delta(compiled.data_in[index], node_data["data_in"])
+        delta_out = node_delta(compiled.data_out[index], node_data["data_out"])
+        rows.append({"run_id": run["run_id"], "node_id": node_id, "delta_in": delta_in, "delta_out": delta_out})
+        full_bytes += (len(json.dumps(node_data["data_in"], default=_column_list))
+                       + len(json.dumps(node_data["data_out"], default=_column_list)))
+        stored_bytes += len(delta_in or "") + len(delta_out or "")
+
+    row = {
+        "run_id": run["run_id"],
+        "graph_id": run["graph_id"],
+        "topo_order": json.dumps(run["topo_order"]),
+        "status": run["status"],
+        "skipped_nodes": json.dumps(list(run["skipped_nodes"])),
+        "config": run_config_json(run["config"]) if run.get("config") is not None else None,
+        "lineage": run.get("lineage") or [run["run_id"]],
+        "sweep_points": run.get("sweep_points"),
+        "stored_bytes": stored_bytes,
+        "saved_bytes": full_bytes - stored_bytes,
+    }
+    return row, rows
+
+
+def node_delta(base, data):
+    """
+    JSON object of the keys of `data` that are new or differ from `base` (NumPy columns stored as
+    lists), or None when nothing changed. Runs only ever set keys, so no removals are recorded.
+    """
+    changed = {
+        key: value for key, value in data.items()
+        if key not in base or type(value) is not type(base[key]) or value != base[key]
+    }
+    return json.dumps(changed, default=_column_list) if changed else None
+
+
+def apply_delta(base, delta):
+    """Reconstruct a stored JSON payload: the graph's `base` JSON with the changed keys of `delta` applied."""
+    if not delta:
+        return base
+    payload = json.loads(base) if base else {}
+    payload.update(json.loads(delta))
+    return json.dumps(payload)
+
+
+def _column_list(column):
+    return column.tolist()
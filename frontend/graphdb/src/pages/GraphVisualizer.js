@@ -32,8 +32,18 @@ const GraphVisualizer = () => {
     const fetchGraphDetails = async () => {
       setLoading(true); // Set loading to true at the start
       try {
-        const response = await axios.get(`http://127.0.0.1:8000/api/graphs/${graph_id}`);
-        const { nodes, edges } = response.data;
+        // Fetch the topology only, page by page; node payloads are loaded when a node is clicked
+        const nodes = [];
+        const edges = [];
+        let cursor = null;
+        do {
+          const response = await axios.get(`http://127.0.0.1:8000/api/graphs/${graph_id}`, {
+            params: { fields: "ids", limit: 5000, cursor },
+          });
+          nodes.push(...response.data.nodes);
+          edges.push(...response.data.edges);
+          cursor = response.data.next_cursor;
+        } while (cursor);
         // Convert edges to links format for react-force-graph
         const links = edges.map((edge) => ({
           source: edge.src,
@@ -57,8 +67,24 @@ const GraphVisualizer = () => {
     fetchGraphDetails();
   }, [graph_id]);
 
-  const handleNodeClick = (node) => {
+  const handleNodeClick = async (node) => {
     setSelectedNode(node);
+    if (node.data_in !== undefined) {
+      return; // Payload already loaded
+    }
+    try {
+      const response = await axios.get(`http://127.0.0.1:8000/api/graphs/${graph_id}/nodes`, {
+        params: { ids: node.id },
+      });
+      const [payload] = response.data.nodes;
+      if (payload) {
+        node.data_in = payload.data_in;
+        node.data_out = payload.data_out;
+        setSelectedNode({ ...node });
+      }
+    } catch (error) {
+      console.error("Error fetching node details:", error);
+    }
   };
   const handleFileChange = (e) => {
     const uploadedFile = e.target.files[0];